@@ -3,31 +3,36 @@ from __future__ import annotations
 import argparse
 import asyncio
 import getpass
-import json
 import logging
 import signal
 import sys
-from datetime import datetime, timezone
-
-import httpx
+from typing import TYPE_CHECKING, Awaitable, Callable
 
 from src.config import Settings
-from src.db.database import init_db
-from src.db.models import CircuitState, Connection, RetryStatus
+from src.db.database import DbPool, init_pool
+from src.db.models import (
+    CIRCUIT_STATE_TO_STR,
+    RETRY_STATUS_TO_STR,
+    CircuitState,
+    Connection,
+    RetryStatus,
+)
 from src.db.repositories import (
     ConnectionRepository,
     RetryQueueRepository,
     SentOrderRepository,
     SyncLogRepository,
+    utc_now,
 )
 from src.encryption import FieldEncryptor
-from src.odoo.client import OdooClient
-from src.odoo.mapper import fetch_batch_data, map_order_to_webhook_payload
-from src.poller.scheduler import Scheduler
-from src.poller.sender import WebhookSender
+
+if TYPE_CHECKING:
+    import httpx
 
 logger = logging.getLogger(__name__)
 
+SEND_CONCURRENCY = 8
+
 
 def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
@@ -100,20 +105,40 @@ class AppContext:
     def __init__(self, settings: Settings) -> None:
         self.settings = settings
         self.encryptor = FieldEncryptor(settings.encryption_key)
-        self.db = None
+        self.db: DbPool | None = None
+        self._http: httpx.AsyncClient | None = None
         self.conn_repo: ConnectionRepository | None = None
         self.sync_log_repo: SyncLogRepository | None = None
         self.retry_repo: RetryQueueRepository | None = None
         self.sent_repo: SentOrderRepository | None = None
 
     async def init(self) -> None:
-        self.db = await init_db(self.settings.db_path)
+        self.db = await init_pool(self.settings.db_path, readers=self.settings.db_readers)
         self.conn_repo = ConnectionRepository(self.db, self.encryptor)
         self.sync_log_repo = SyncLogRepository(self.db)
         self.retry_repo = RetryQueueRepository(self.db)
         self.sent_repo = SentOrderRepository(self.db)
 
+    @property
+    def http(self) -> httpx.AsyncClient:
+        # Lazy: los comandos de solo lectura no necesitan importar httpx
+        if self._http is None:
+            import httpx
+
+            self._http = httpx.AsyncClient(
+                timeout=httpx.Timeout(30.0, connect=5.0),
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=100,
+                    max_keepalive_connections=50,
+                    keepalive_expiry=60.0,
+                ),
+            )
+        return self._http
+
     async def close(self) -> None:
+        if self._http:
+            await self._http.aclose()
         if self.db:
             await self.db.close()
 
@@ -134,23 +159,50 @@ def _print_table(headers: list[str], rows: list[list[str]]) -> None:
         print("  (sin resultados)")
         return
 
+    ncols = len(headers)
     widths = [len(h) for h in headers]
+    cells = []
     for row in rows:
-        for i, cell in enumerate(row):
-            if i < len(widths):
-                widths[i] = max(widths[i], len(cell))
+        padded = (row + [""] * (ncols - len(row)))[:ncols]
+        widths = [max(w, len(c)) for w, c in zip(widths, padded)]
+        cells.append(padded)
+
+    def _line(values: list[str]) -> str:
+        return "  ".join(v.ljust(w) for v, w in zip(values, widths))
+
+    lines = [_line(headers), _line(["-" * w for w in widths])]
+    lines.extend(_line(row) for row in cells)
+    sys.stdout.write("\n".join(lines) + "\n")
 
-    fmt = "  ".join(f"{{:<{w}}}" for w in widths)
-    print(fmt.format(*headers))
-    print(fmt.format(*["-" * w for w in widths]))
-    for row in rows:
-        padded = row + [""] * (len(headers) - len(row))
-        print(fmt.format(*padded))
+
+_stop_handlers_installed = False
+
+
+def _install_stop_handlers(stop_event: asyncio.Event) -> None:
+    """Conecta SIGTERM a `stop_event`, una sola vez por proceso.
+
+    SIGINT lo maneja `asyncio.run()`: cancela la tarea principal.
+    """
+    global _stop_handlers_installed
+    if _stop_handlers_installed:
+        return
+    _stop_handlers_installed = True
+
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, stop_event.set)
+    except NotImplementedError:
+        # Windows: el handler síncrono corre fuera del loop
+        signal.signal(
+            signal.SIGTERM, lambda *_: loop.call_soon_threadsafe(stop_event.set)
+        )
 
 
 # ── Commands ─────────────────────────────────────────────────
 
 async def cmd_run(ctx: AppContext) -> None:
+    from src.poller.scheduler import Scheduler
+
     print("Iniciando polling...")
 
     async def on_sync(conn_id: int, sync_log) -> None:
@@ -170,7 +222,12 @@ async def cmd_run(ctx: AppContext) -> None:
                 )
 
     async def on_circuit(conn_id: int, state: CircuitState) -> None:
-        logger.warning("Conn #%d: circuit breaker -> %s", conn_id, state.value)
+        logger.warning(
+            "Conn #%d: circuit breaker -> %s", conn_id, CIRCUIT_STATE_TO_STR[state]
+        )
+
+    stop_event = asyncio.Event()
+    _install_stop_handlers(stop_event)
 
     scheduler = Scheduler(
         conn_repo=ctx.conn_repo,
@@ -179,31 +236,30 @@ async def cmd_run(ctx: AppContext) -> None:
         sent_repo=ctx.sent_repo,
         on_sync_complete=on_sync,
         on_circuit_state_change=on_circuit,
+        stop_event=stop_event,
+        http_client=ctx.http,
+        max_concurrent_cycles=ctx.settings.max_concurrent_polls,
     )
 
     await scheduler.start()
 
-    conns = await ctx.conn_repo.list_enabled()
+    conns = await ctx.conn_repo.list_enabled(with_secrets=False)
     if conns:
         print(f"Polling activo para {len(conns)} conexión(es). Ctrl+C para detener.\n")
     else:
         print("No hay conexiones habilitadas. Esperando que se agreguen...")
         print("Usa 'python -m src.main add' para crear una.\n")
 
-    stop_event = asyncio.Event()
-    loop = asyncio.get_event_loop()
-    for sig in (signal.SIGTERM, signal.SIGINT):
-        try:
-            loop.add_signal_handler(sig, stop_event.set)
-        except NotImplementedError:
-            pass
-
     # Revisar periódicamente si hay conexiones nuevas/removidas
     async def watch_connections() -> None:
         known_ids: set[int] = {c.id for c in conns}
         while not stop_event.is_set():
-            await asyncio.sleep(15)
-            current = await ctx.conn_repo.list_enabled()
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=15)
+                break
+            except TimeoutError:
+                pass
+            current = await ctx.conn_repo.list_enabled(with_secrets=False)
             current_ids = {c.id for c in current}
 
             for conn in current:
@@ -219,7 +275,12 @@ async def cmd_run(ctx: AppContext) -> None:
 
     watcher = asyncio.create_task(watch_connections())
 
-    await stop_event.wait()
+    try:
+        await stop_event.wait()
+    except asyncio.CancelledError:
+        # Ctrl+C: asyncio.run() cancela la tarea principal
+        asyncio.current_task().uncancel()
+        stop_event.set()
 
     watcher.cancel()
     print("\nDeteniendo polling...")
@@ -271,7 +332,7 @@ async def cmd_add(ctx: AppContext, args: argparse.Namespace | None = None) -> No
 
 
 async def cmd_list(ctx: AppContext) -> None:
-    connections = await ctx.conn_repo.list_all()
+    connections = await ctx.conn_repo.list_all(with_secrets=False)
     if not connections:
         print("No hay conexiones configuradas. Usa 'odoo-poller add' para crear una.")
         return
@@ -287,7 +348,7 @@ async def cmd_list(ctx: AppContext) -> None:
             c.odoo_db,
             f"{c.poll_interval_seconds}s",
             "ON" if c.enabled else "OFF",
-            c.circuit_state.value,
+            CIRCUIT_STATE_TO_STR[c.circuit_state],
             c.last_sync_at or "nunca",
         ])
 
@@ -344,6 +405,10 @@ async def cmd_delete(ctx: AppContext, conn_id: int) -> None:
 
 
 async def cmd_test(ctx: AppContext, conn_id: int) -> None:
+    import orjson
+
+    from src.odoo.client import OdooClient
+
     conn = await ctx.conn_repo.get(conn_id)
     if not conn:
         print(f"Conexión #{conn_id} no encontrada.")
@@ -352,13 +417,12 @@ async def cmd_test(ctx: AppContext, conn_id: int) -> None:
     # Test Odoo
     print(f"Probando conexión Odoo '{conn.name}'...")
     try:
-        async with httpx.AsyncClient(timeout=30.0) as http:
-            client = OdooClient(
-                conn.odoo_url, conn.odoo_db, conn.odoo_username, conn.odoo_api_key,
-                http_client=http,
-            )
-            uid = await client.authenticate()
-            print(f"  Odoo OK - UID: {uid}")
+        client = OdooClient(
+            conn.odoo_url, conn.odoo_db, conn.odoo_username, conn.odoo_api_key,
+            http_client=ctx.http,
+        )
+        uid = await client.authenticate()
+        print(f"  Odoo OK - UID: {uid}")
     except Exception as e:
         print(f"  Odoo ERROR: {e}")
 
@@ -372,10 +436,14 @@ async def cmd_test(ctx: AppContext, conn_id: int) -> None:
         headers["X-Odoo-Connection-Id"] = conn.external_id
         payload = {"source": "odoo", "test": True, "connection_name": conn.name}
         try:
-            async with httpx.AsyncClient(timeout=15.0) as http:
-                resp = await http.post(conn.webhook_url, json=payload, headers=headers)
-                resp.raise_for_status()
-                print(f"  Webhook OK - Status: {resp.status_code}")
+            resp = await ctx.http.post(
+                conn.webhook_url,
+                content=orjson.dumps(payload),
+                headers=headers,
+                timeout=15.0,
+            )
+            resp.raise_for_status()
+            print(f"  Webhook OK - Status: {resp.status_code}")
         except Exception as e:
             print(f"  Webhook ERROR: {e}")
 
@@ -384,12 +452,7 @@ async def cmd_logs(ctx: AppContext, connection_id: int | None, limit: int) -> No
     if connection_id:
         logs = await ctx.sync_log_repo.list_by_connection(connection_id, limit=limit)
     else:
-        connections = await ctx.conn_repo.list_all()
-        logs = []
-        for c in connections:
-            logs.extend(await ctx.sync_log_repo.list_by_connection(c.id, limit=limit))
-        logs.sort(key=lambda l: l.id or 0, reverse=True)
-        logs = logs[:limit]
+        logs = await ctx.sync_log_repo.list_recent(limit=limit)
 
     headers = ["ID", "Conn", "Inicio", "Encontradas", "Enviadas", "Fallidas", "Skip", "Error"]
     rows = []
@@ -412,11 +475,8 @@ async def cmd_retries(ctx: AppContext, connection_id: int | None) -> None:
     if connection_id:
         items = await ctx.retry_repo.list_by_connection(connection_id)
     else:
-        connections = await ctx.conn_repo.list_all()
-        items = []
-        for c in connections:
-            items.extend(await ctx.retry_repo.list_by_connection(c.id))
-        items.sort(key=lambda i: i.id or 0, reverse=True)
+        connections = await ctx.conn_repo.list_all(with_secrets=False)
+        items = await ctx.retry_repo.list_by_connections([c.id for c in connections])
 
     headers = ["ID", "Conn", "Orden", "Estado", "Intentos", "Próximo Retry", "Error"]
     rows = []
@@ -425,7 +485,7 @@ async def cmd_retries(ctx: AppContext, connection_id: int | None) -> None:
             str(item.id),
             str(item.connection_id),
             item.odoo_order_name or str(item.odoo_order_id),
-            item.status.value,
+            RETRY_STATUS_TO_STR[item.status],
             f"{item.attempts}/{item.max_attempts}",
             item.next_retry_at,
             (item.last_error or "")[:40],
@@ -435,9 +495,8 @@ async def cmd_retries(ctx: AppContext, connection_id: int | None) -> None:
 
 
 async def cmd_retry_now(ctx: AppContext, item_id: int) -> None:
-    now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
     await ctx.retry_repo.update_status(
-        item_id, RetryStatus.PENDING, next_retry_at=now
+        item_id, RetryStatus.PENDING, next_retry_at=utc_now()
     )
     print(f"Retry #{item_id} marcado para reintento inmediato.")
 
@@ -458,6 +517,11 @@ async def cmd_reset_circuit(ctx: AppContext, conn_id: int) -> None:
 
 
 async def cmd_send(ctx: AppContext, connection_id: int, last: int) -> None:
+    from src.odoo.client import OdooClient
+    from src.odoo.mapper import fetch_batch_data, map_order_to_webhook_payload
+    from src.poller.sender import WebhookSender
+    from src.poller.worker import ORDER_FIELDS
+
     conn = await ctx.conn_repo.get(connection_id)
     if not conn:
         print(f"Conexión #{connection_id} no encontrada.")
@@ -510,33 +574,27 @@ async def cmd_send(ctx: AppContext, connection_id: int, last: int) -> None:
 
     print(f"\nEnviando {len(selected)} orden(es) vía webhook...")
 
-    async with httpx.AsyncClient(timeout=30.0) as http:
-        client = OdooClient(
-            conn.odoo_url, conn.odoo_db, conn.odoo_username, conn.odoo_api_key,
-            http_client=http,
-        )
-        sender = WebhookSender(http)
+    client = OdooClient(
+        conn.odoo_url, conn.odoo_db, conn.odoo_username, conn.odoo_api_key,
+        http_client=ctx.http,
+    )
+    sender = WebhookSender(ctx.http)
+
+    await client.authenticate()
 
-        await client.authenticate()
+    sem = asyncio.Semaphore(SEND_CONCURRENCY)
 
-        ok = 0
-        fail = 0
-        for so in selected:
+    async def _send_one(so) -> bool:
+        async with sem:
             try:
                 orders = await client.search_read(
                     "sale.order",
                     [["id", "=", so.odoo_order_id]],
-                    [
-                        "name", "state", "date_order", "write_date",
-                        "partner_id", "partner_shipping_id",
-                        "amount_untaxed", "amount_tax", "amount_total",
-                        "currency_id", "note",
-                    ],
+                    ORDER_FIELDS,
                 )
                 if not orders:
                     print(f"  {so.odoo_order_name}: orden no encontrada en Odoo, saltando.")
-                    fail += 1
-                    continue
+                    return False
 
                 batch = await fetch_batch_data(client, orders)
                 payload = map_order_to_webhook_payload(
@@ -546,48 +604,49 @@ async def cmd_send(ctx: AppContext, connection_id: int, last: int) -> None:
                     conn.webhook_url, payload, conn.webhook_secret, conn.external_id
                 )
                 print(f"  {so.odoo_order_name}: OK")
-                ok += 1
+                return True
             except Exception as e:
                 print(f"  {so.odoo_order_name}: ERROR - {e}")
-                fail += 1
+                return False
+
+    results = await asyncio.gather(*(_send_one(so) for so in selected))
+    ok = sum(results)
+    fail = len(results) - ok
 
     print(f"\nResumen: {ok} enviadas, {fail} fallidas.")
 
 
 # ── Main dispatch ────────────────────────────────────────────
 
+CommandHandler = Callable[[AppContext, argparse.Namespace], Awaitable[None]]
+
+COMMANDS: dict[str, CommandHandler] = {
+    "run": lambda ctx, args: cmd_run(ctx),
+    "add": cmd_add,
+    "list": lambda ctx, args: cmd_list(ctx),
+    "edit": lambda ctx, args: cmd_edit(ctx, args.id),
+    "delete": lambda ctx, args: cmd_delete(ctx, args.id),
+    "test": lambda ctx, args: cmd_test(ctx, args.id),
+    "logs": lambda ctx, args: cmd_logs(ctx, args.connection, args.limit),
+    "retries": lambda ctx, args: cmd_retries(ctx, args.connection),
+    "retry": lambda ctx, args: cmd_retry_now(ctx, args.id),
+    "discard": lambda ctx, args: cmd_discard(ctx, args.id),
+    "reset-circuit": lambda ctx, args: cmd_reset_circuit(ctx, args.id),
+    "send": lambda ctx, args: cmd_send(ctx, args.connection, args.last),
+}
+
+
 async def run_cli(args: argparse.Namespace) -> None:
+    handler = COMMANDS.get(args.command)
+    if handler is None:
+        build_parser().print_help()
+        return
+
     settings = Settings.load()
     ctx = AppContext(settings)
     await ctx.init()
 
     try:
-        match args.command:
-            case "run":
-                await cmd_run(ctx)
-            case "add":
-                await cmd_add(ctx, args)
-            case "list":
-                await cmd_list(ctx)
-            case "edit":
-                await cmd_edit(ctx, args.id)
-            case "delete":
-                await cmd_delete(ctx, args.id)
-            case "test":
-                await cmd_test(ctx, args.id)
-            case "logs":
-                await cmd_logs(ctx, args.connection, args.limit)
-            case "retries":
-                await cmd_retries(ctx, args.connection)
-            case "retry":
-                await cmd_retry_now(ctx, args.id)
-            case "discard":
-                await cmd_discard(ctx, args.id)
-            case "reset-circuit":
-                await cmd_reset_circuit(ctx, args.id)
-            case "send":
-                await cmd_send(ctx, args.connection, args.last)
-            case _:
-                build_parser().print_help()
+        await handler(ctx, args)
     finally:
         await ctx.close()
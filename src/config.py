@@ -4,6 +4,24 @@ from dataclasses import dataclass
 
 from env_manager import get_config, require_config
 
+from src.db.database import DEFAULT_DB_READERS
+
+
+_cached: Settings | None = None
+
+
+def _int_config(name: str, default: int, minimum: int) -> int:
+    raw = get_config(name)
+    if not raw:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise RuntimeError(f"{name} debe ser un entero, no {raw!r}") from None
+    if value < minimum:
+        raise RuntimeError(f"{name} debe ser >= {minimum} (valor: {value})")
+    return value
+
 
 @dataclass(frozen=True)
 class Settings:
@@ -11,9 +29,25 @@ class Settings:
     log_level: str
     encryption_key: str
     default_webhook_url: str
+    db_readers: int = DEFAULT_DB_READERS
+    max_concurrent_polls: int = 16
 
     @classmethod
     def load(cls) -> Settings:
+        """Lee la configuración una sola vez por proceso (ver `reload`)."""
+        global _cached
+        if _cached is None:
+            _cached = cls._read()
+        return _cached
+
+    @classmethod
+    def reload(cls) -> Settings:
+        global _cached
+        _cached = cls._read()
+        return _cached
+
+    @classmethod
+    def _read(cls) -> Settings:
         encryption_key = require_config("POLLER_ENCRYPTION_KEY")
         if not encryption_key:
             raise RuntimeError(
@@ -26,4 +60,7 @@ class Settings:
             log_level=get_config("POLLER_LOG_LEVEL") or "INFO",
             encryption_key=encryption_key,
             default_webhook_url=get_config("POLLER_DEFAULT_WEBHOOK_URL") or "",
+            db_readers=_int_config("POLLER_DB_READERS", DEFAULT_DB_READERS, minimum=0),
+            # 0 dejaría todos los poll loops esperando el semáforo para siempre
+            max_concurrent_polls=_int_config("POLLER_MAX_CONCURRENT_POLLS", 16, minimum=1),
         )
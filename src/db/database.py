@@ -1,6 +1,10 @@
 from __future__ import annotations
 
+import asyncio
 import os
+import weakref
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable
 
 import aiosqlite
 
@@ -12,9 +16,9 @@ CREATE TABLE IF NOT EXISTS connections (
     odoo_url TEXT NOT NULL,
     odoo_db TEXT NOT NULL,
     odoo_username TEXT NOT NULL,
-    odoo_api_key TEXT NOT NULL,
+    odoo_api_key BLOB NOT NULL,
     webhook_url TEXT NOT NULL,
-    webhook_secret TEXT NOT NULL DEFAULT '',
+    webhook_secret BLOB NOT NULL DEFAULT x'',
     poll_interval_seconds INTEGER NOT NULL DEFAULT 60,
     enabled INTEGER NOT NULL DEFAULT 1,
     circuit_state TEXT NOT NULL DEFAULT 'closed',
@@ -42,7 +46,8 @@ CREATE TABLE IF NOT EXISTS retry_queue (
     connection_id INTEGER NOT NULL REFERENCES connections(id) ON DELETE CASCADE,
     odoo_order_id INTEGER NOT NULL,
     odoo_order_name TEXT NOT NULL DEFAULT '',
-    payload TEXT NOT NULL,
+    odoo_write_date TEXT NOT NULL DEFAULT '',
+    payload BLOB NOT NULL,
     status TEXT NOT NULL DEFAULT 'pending',
     attempts INTEGER NOT NULL DEFAULT 0,
     max_attempts INTEGER NOT NULL DEFAULT 5,
@@ -63,18 +68,42 @@ CREATE TABLE IF NOT EXISTS sent_orders (
 
 CREATE INDEX IF NOT EXISTS idx_sync_logs_connection ON sync_logs(connection_id);
 CREATE INDEX IF NOT EXISTS idx_retry_queue_connection_status ON retry_queue(connection_id, status);
-CREATE INDEX IF NOT EXISTS idx_retry_queue_next_retry ON retry_queue(next_retry_at) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_retry_queue_due ON retry_queue(connection_id, next_retry_at) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_retry_queue_connection_id ON retry_queue(connection_id, id);
 CREATE UNIQUE INDEX IF NOT EXISTS idx_sent_orders_unique ON sent_orders(connection_id, odoo_order_id, odoo_write_date);
 CREATE INDEX IF NOT EXISTS idx_sent_orders_connection ON sent_orders(connection_id);
+CREATE INDEX IF NOT EXISTS idx_sent_orders_sent_at ON sent_orders(connection_id, sent_at, id);
 """
 
+# Con WAL, synchronous=NORMAL solo hace fsync en checkpoints: un crash puede
+# perder las últimas transacciones confirmadas, pero nunca corrompe la DB.
+_PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA temp_store=MEMORY;
+PRAGMA mmap_size=268435456;
+PRAGMA cache_size=-65536;
+PRAGMA busy_timeout=5000;
+PRAGMA foreign_keys=ON;
+"""
+
+
+# Conexiones lectoras del pool (POLLER_DB_READERS)
+DEFAULT_DB_READERS = 4
+
+# sqlite3 reutiliza statements preparados por texto SQL (LRU, 128 por defecto).
+# Las queries con `IN (?, ?, ...)` generan un texto por cantidad de IDs y
+# desplazaban a los statements fijos del ciclo de polling.
+_CACHED_STATEMENTS = 512
 
-async def get_connection(db_path: str) -> aiosqlite.Connection:
+
+async def get_connection(db_path: str, read_only: bool = False) -> aiosqlite.Connection:
     os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
-    db = await aiosqlite.connect(db_path)
+    db = await aiosqlite.connect(db_path, cached_statements=_CACHED_STATEMENTS)
     db.row_factory = aiosqlite.Row
-    await db.execute("PRAGMA journal_mode=WAL")
-    await db.execute("PRAGMA foreign_keys=ON")
+    await db.executescript(_PRAGMAS)
+    if read_only:
+        await db.execute("PRAGMA query_only=1")
     return db
 
 
@@ -86,6 +115,26 @@ async def _migrate(db: aiosqlite.Connection) -> None:
         await db.execute("ALTER TABLE connections ADD COLUMN external_id TEXT NOT NULL DEFAULT ''")
         await db.commit()
 
+    cursor = await db.execute("PRAGMA table_info(retry_queue)")
+    columns = {row[1] for row in await cursor.fetchall()}
+    if "odoo_write_date" not in columns:
+        await db.execute("ALTER TABLE retry_queue ADD COLUMN odoo_write_date TEXT NOT NULL DEFAULT ''")
+        await db.commit()
+
+    # idx_retry_queue_due (connection_id, next_retry_at) cubre get_pending;
+    # el índice viejo solo sumaba costo a cada escritura de la retry queue
+    await db.execute("DROP INDEX IF EXISTS idx_retry_queue_next_retry")
+    await db.commit()
+
+    # Tokens Fernet guardados como TEXT antes de pasar a BLOB (son ASCII)
+    await db.execute(
+        """UPDATE connections SET
+           odoo_api_key = CAST(odoo_api_key AS BLOB),
+           webhook_secret = CAST(webhook_secret AS BLOB)
+           WHERE typeof(odoo_api_key) = 'text' OR typeof(webhook_secret) = 'text'"""
+    )
+    await db.commit()
+
 
 async def init_db(db_path: str) -> aiosqlite.Connection:
     db = await get_connection(db_path)
@@ -93,3 +142,97 @@ async def init_db(db_path: str) -> aiosqlite.Connection:
     await db.commit()
     await _migrate(db)
     return db
+
+
+# Pool de cada conexión escritora: los repositories creados sobre la misma
+# conexión comparten el lock de escritura
+_POOLS: weakref.WeakKeyDictionary[aiosqlite.Connection, DbPool] = weakref.WeakKeyDictionary()
+
+
+class DbPool:
+    """Una conexión escritora y N lectoras sobre la misma DB en modo WAL.
+
+    Las lectoras solo ven datos confirmados. Sin lectoras (p.ej. `:memory:`),
+    las lecturas usan la conexión escritora. Las escrituras van siempre dentro
+    de `transaction()`.
+    """
+
+    def __init__(
+        self,
+        writer: aiosqlite.Connection,
+        readers: list[aiosqlite.Connection] | None = None,
+    ) -> None:
+        self.writer = writer
+        self._readers = readers or []
+        self._idle: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+        for r in self._readers:
+            self._idle.put_nowait(r)
+        self._write_lock = asyncio.Lock()
+        self._tx_owner: asyncio.Task | None = None
+        self._after_commit: list[Callable[[], None]] = []
+        _POOLS[writer] = self
+
+    @classmethod
+    def for_writer(cls, writer: aiosqlite.Connection) -> DbPool:
+        return _POOLS.get(writer) or cls(writer)
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Transacción de escritura: BEGIN IMMEDIATE … COMMIT, o ROLLBACK si falla.
+
+        Todas las tasks comparten la conexión escritora: el lock se mantiene
+        de BEGIN a COMMIT/ROLLBACK para que ninguna confirme ni descarte
+        escrituras de otra. Anidada en la misma task se suma a la transacción
+        en curso.
+        """
+        task = asyncio.current_task()
+        if self._tx_owner is task:
+            yield self.writer
+            return
+        async with self._write_lock:
+            self._tx_owner = task
+            try:
+                await self.writer.execute("BEGIN IMMEDIATE")
+                try:
+                    yield self.writer
+                    await self.writer.commit()
+                except BaseException:
+                    await self.writer.rollback()
+                    raise
+                for callback in self._after_commit:
+                    callback()
+            finally:
+                self._tx_owner = None
+                self._after_commit.clear()
+
+    def after_commit(self, callback: Callable[[], None]) -> None:
+        """Ejecuta `callback` solo si la transacción en curso se confirma.
+
+        Para caches en memoria que no deben reflejar escrituras descartadas.
+        """
+        self._after_commit.append(callback)
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        if not self._readers:
+            yield self.writer
+            return
+        db = await self._idle.get()
+        try:
+            yield db
+        finally:
+            self._idle.put_nowait(db)
+
+    async def close(self) -> None:
+        for r in self._readers:
+            await r.close()
+        await self.writer.close()
+
+
+async def init_pool(db_path: str, readers: int = DEFAULT_DB_READERS) -> DbPool:
+    writer = await init_db(db_path)
+    if db_path == ":memory:" or db_path.startswith("file::memory:"):
+        readers = 0
+    return DbPool(
+        writer, [await get_connection(db_path, read_only=True) for _ in range(readers)]
+    )
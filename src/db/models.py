@@ -17,7 +17,14 @@ class RetryStatus(enum.Enum):
     DISCARDED = "discarded"
 
 
-@dataclass
+# Lookups precalculados enum <-> valor en DB
+CIRCUIT_STATE_TO_STR: dict[CircuitState, str] = {s: s.value for s in CircuitState}
+STR_TO_CIRCUIT_STATE: dict[str, CircuitState] = {v: s for s, v in CIRCUIT_STATE_TO_STR.items()}
+RETRY_STATUS_TO_STR: dict[RetryStatus, str] = {s: s.value for s in RetryStatus}
+STR_TO_RETRY_STATUS: dict[str, RetryStatus] = {v: s for s, v in RETRY_STATUS_TO_STR.items()}
+
+
+@dataclass(slots=True)
 class Connection:
     id: int | None = None
     name: str = ""
@@ -38,7 +45,7 @@ class Connection:
     updated_at: str = ""
 
 
-@dataclass
+@dataclass(slots=True)
 class SyncLog:
     id: int | None = None
     connection_id: int = 0
@@ -51,13 +58,13 @@ class SyncLog:
     error_message: str | None = None
 
 
-@dataclass
+@dataclass(slots=True)
 class RetryItem:
     id: int | None = None
     connection_id: int = 0
     odoo_order_id: int = 0
     odoo_order_name: str = ""
-    payload: str = ""  # JSON serializado
+    payload: bytes | str = ""  # JSON serializado (bytes; filas antiguas: str)
     status: RetryStatus = RetryStatus.PENDING
     attempts: int = 0
     max_attempts: int = 5
@@ -65,9 +72,10 @@ class RetryItem:
     last_error: str | None = None
     created_at: str = ""
     updated_at: str = ""
+    odoo_write_date: str = ""  # evita decodificar el payload al marcar enviada
 
 
-@dataclass
+@dataclass(slots=True)
 class SentOrder:
     id: int | None = None
     connection_id: int = 0
@@ -1,11 +1,19 @@
 from __future__ import annotations
 
-import json
-from datetime import datetime, timezone
+import sqlite3
+import time
+from collections import OrderedDict
+from contextlib import AbstractAsyncContextManager
+from functools import partial
+from typing import Any, Callable
 
 import aiosqlite
 
 from src.db.models import (
+    CIRCUIT_STATE_TO_STR,
+    RETRY_STATUS_TO_STR,
+    STR_TO_CIRCUIT_STATE,
+    STR_TO_RETRY_STATUS,
     CircuitState,
     Connection,
     RetryItem,
@@ -13,92 +21,263 @@ from src.db.models import (
     SentOrder,
     SyncLog,
 )
+from src.db.database import DbPool
 from src.encryption import FieldEncryptor
 
 
-def _now() -> str:
-    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+_now_cache: tuple[int, str] = (0, "")
 
 
-class ConnectionRepository:
-    def __init__(self, db: aiosqlite.Connection, encryptor: FieldEncryptor) -> None:
-        self._db = db
+def utc_now(offset_seconds: int = 0) -> str:
+    """Timestamp UTC `YYYY-MM-DD HH:MM:SS`, formateado una sola vez por segundo.
+
+    Con `offset_seconds` devuelve el instante `ahora + offset` (sin cache).
+    """
+    global _now_cache
+    if offset_seconds:
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time.time() + offset_seconds))
+    sec = int(time.time())
+    if sec != _now_cache[0]:
+        _now_cache = (sec, time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(sec)))
+    return _now_cache[1]
+
+
+def _as_pool(db: aiosqlite.Connection | DbPool) -> DbPool:
+    return db if isinstance(db, DbPool) else DbPool.for_writer(db)
+
+
+RowFactory = Callable[[sqlite3.Cursor, tuple], Any]
+
+
+async def _read_all(
+    pool: DbPool, sql: str, params: tuple = (), row_factory: RowFactory | None = None
+) -> list[Any]:
+    async with pool.reader() as db:
+        cursor = await db.execute(sql, params)
+        if row_factory:
+            # El modelo se construye en el hilo de aiosqlite, sin aiosqlite.Row
+            cursor.row_factory = row_factory
+        return await cursor.fetchall()
+
+
+async def _read_one(
+    pool: DbPool, sql: str, params: tuple = (), row_factory: RowFactory | None = None
+) -> Any | None:
+    async with pool.reader() as db:
+        cursor = await db.execute(sql, params)
+        if row_factory:
+            cursor.row_factory = row_factory
+        return await cursor.fetchone()
+
+
+async def _execute_tx(pool: DbPool, sql: str, params: tuple = ()) -> aiosqlite.Cursor:
+    async with pool.transaction() as db:
+        return await db.execute(sql, params)
+
+
+async def _executemany_tx(pool: DbPool, sql: str, rows: list[tuple]) -> None:
+    """Ejecuta `sql` para todas las filas en una sola transacción.
+
+    Dentro de un `pool.transaction()` de la misma task, se suma a ella.
+    """
+    async with pool.transaction() as db:
+        await db.executemany(sql, rows)
+
+
+# Orden fijo de columnas = orden de campos del dataclass; los row factories
+# construyen los modelos por posición
+_CONNECTION_COLUMNS = (
+    "id, name, external_id, odoo_url, odoo_db, odoo_username, odoo_api_key, "
+    "webhook_url, webhook_secret, poll_interval_seconds, enabled, circuit_state, "
+    "circuit_failure_count, circuit_last_failure_at, last_sync_at, created_at, updated_at"
+)
+_SYNC_LOG_COLUMNS = (
+    "id, connection_id, started_at, finished_at, orders_found, "
+    "orders_sent, orders_failed, orders_skipped, error_message"
+)
+_RETRY_ITEM_COLUMNS = (
+    "id, connection_id, odoo_order_id, odoo_order_name, payload, status, "
+    "attempts, max_attempts, next_retry_at, last_error, created_at, updated_at, "
+    "odoo_write_date"
+)
+_SENT_ORDER_COLUMNS = (
+    "id, connection_id, odoo_order_id, odoo_order_name, odoo_write_date, sent_at"
+)
+
+
+def _connection_from_row(cursor: sqlite3.Cursor, row: tuple) -> Connection:
+    # odoo_api_key/webhook_secret quedan encriptados; ConnectionRepository los resuelve
+    return Connection(
+        id=row[0],
+        name=row[1],
+        external_id=row[2] or "",
+        odoo_url=row[3],
+        odoo_db=row[4],
+        odoo_username=row[5],
+        odoo_api_key=row[6],
+        webhook_url=row[7],
+        webhook_secret=row[8],
+        poll_interval_seconds=row[9],
+        enabled=bool(row[10]),
+        circuit_state=STR_TO_CIRCUIT_STATE[row[11]],
+        circuit_failure_count=row[12],
+        circuit_last_failure_at=row[13],
+        last_sync_at=row[14],
+        created_at=row[15],
+        updated_at=row[16],
+    )
+
+
+def _sync_log_from_row(cursor: sqlite3.Cursor, row: tuple) -> SyncLog:
+    return SyncLog(*row)
+
+
+def _retry_item_from_row(cursor: sqlite3.Cursor, row: tuple) -> RetryItem:
+    return RetryItem(*row[:5], STR_TO_RETRY_STATUS[row[5]], *row[6:])
+
+
+def _sent_order_from_row(cursor: sqlite3.Cursor, row: tuple) -> SentOrder:
+    return SentOrder(*row)
+
+
+class _Repository:
+    def __init__(self, db: aiosqlite.Connection | DbPool) -> None:
+        self._pool = _as_pool(db)
+
+    def transaction(self) -> AbstractAsyncContextManager[aiosqlite.Connection]:
+        """Agrupa en una transacción las escrituras de la task dentro del bloque,
+        hechas con cualquier repository del mismo pool."""
+        return self._pool.transaction()
+
+
+class ConnectionRepository(_Repository):
+    def __init__(
+        self, db: aiosqlite.Connection | DbPool, encryptor: FieldEncryptor
+    ) -> None:
+        super().__init__(db)
         self._enc = encryptor
 
-    def _row_to_model(self, row: aiosqlite.Row) -> Connection:
-        return Connection(
-            id=row["id"],
-            name=row["name"],
-            external_id=row["external_id"] or "",
-            odoo_url=row["odoo_url"],
-            odoo_db=row["odoo_db"],
-            odoo_username=row["odoo_username"],
-            odoo_api_key=self._enc.decrypt(row["odoo_api_key"]),
-            webhook_url=row["webhook_url"],
-            webhook_secret=self._enc.decrypt(row["webhook_secret"]) if row["webhook_secret"] else "",
-            poll_interval_seconds=row["poll_interval_seconds"],
-            enabled=bool(row["enabled"]),
-            circuit_state=CircuitState(row["circuit_state"]),
-            circuit_failure_count=row["circuit_failure_count"],
-            circuit_last_failure_at=row["circuit_last_failure_at"],
-            last_sync_at=row["last_sync_at"],
-            created_at=row["created_at"],
-            updated_at=row["updated_at"],
+    def _resolve_secrets(
+        self, conns: list[Connection], with_secrets: bool = True
+    ) -> list[Connection]:
+        if not with_secrets:
+            # Listados de metadata: sin desencriptar, secretos quedan vacíos
+            for c in conns:
+                c.odoo_api_key = c.webhook_secret = ""
+            return conns
+        api_keys = self._enc.decrypt_many([c.odoo_api_key for c in conns])
+        with_secret = [c for c in conns if c.webhook_secret]
+        secrets = self._enc.decrypt_many([c.webhook_secret for c in with_secret])
+        for c in conns:
+            c.webhook_secret = ""
+        for c, secret in zip(with_secret, secrets):
+            c.webhook_secret = secret
+        for c, api_key in zip(conns, api_keys):
+            c.odoo_api_key = api_key
+        return conns
+
+    async def list_all(self, with_secrets: bool = True) -> list[Connection]:
+        conns = await _read_all(
+            self._pool,
+            f"SELECT {_CONNECTION_COLUMNS} FROM connections ORDER BY name",
+            row_factory=_connection_from_row,
         )
+        return self._resolve_secrets(conns, with_secrets)
 
-    async def list_all(self) -> list[Connection]:
-        cursor = await self._db.execute("SELECT * FROM connections ORDER BY name")
-        rows = await cursor.fetchall()
-        return [self._row_to_model(r) for r in rows]
-
-    async def list_enabled(self) -> list[Connection]:
-        cursor = await self._db.execute(
-            "SELECT * FROM connections WHERE enabled = 1 ORDER BY name"
+    async def list_enabled(self, with_secrets: bool = True) -> list[Connection]:
+        conns = await _read_all(
+            self._pool,
+            f"SELECT {_CONNECTION_COLUMNS} FROM connections WHERE enabled = 1 ORDER BY name",
+            row_factory=_connection_from_row,
         )
-        rows = await cursor.fetchall()
-        return [self._row_to_model(r) for r in rows]
+        return self._resolve_secrets(conns, with_secrets)
 
     async def get(self, conn_id: int) -> Connection | None:
-        cursor = await self._db.execute(
-            "SELECT * FROM connections WHERE id = ?", (conn_id,)
+        conn = await _read_one(
+            self._pool,
+            f"SELECT {_CONNECTION_COLUMNS} FROM connections WHERE id = ?",
+            (conn_id,),
+            row_factory=_connection_from_row,
         )
-        row = await cursor.fetchone()
-        return self._row_to_model(row) if row else None
+        return self._resolve_secrets([conn])[0] if conn else None
 
-    async def create(self, conn: Connection) -> Connection:
-        now = _now()
-        cursor = await self._db.execute(
-            """INSERT INTO connections
+    _INSERT_SQL = """INSERT INTO connections
                (name, external_id, odoo_url, odoo_db, odoo_username, odoo_api_key,
                 webhook_url, webhook_secret, poll_interval_seconds, enabled,
                 circuit_state, circuit_failure_count, created_at, updated_at)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (
-                conn.name,
-                conn.external_id,
-                conn.odoo_url,
-                conn.odoo_db,
-                conn.odoo_username,
-                self._enc.encrypt(conn.odoo_api_key),
-                conn.webhook_url,
-                self._enc.encrypt(conn.webhook_secret) if conn.webhook_secret else "",
-                conn.poll_interval_seconds,
-                int(conn.enabled),
-                conn.circuit_state.value,
-                0,
-                now,
-                now,
-            ),
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
+    def _insert_row(
+        self, conn: Connection, api_key: bytes, webhook_secret: bytes, now: str
+    ) -> tuple:
+        return (
+            conn.name,
+            conn.external_id,
+            conn.odoo_url,
+            conn.odoo_db,
+            conn.odoo_username,
+            api_key,
+            conn.webhook_url,
+            webhook_secret,
+            conn.poll_interval_seconds,
+            int(conn.enabled),
+            CIRCUIT_STATE_TO_STR[conn.circuit_state],
+            0,
+            now,
+            now,
         )
-        await self._db.commit()
+
+    def _encrypt_secrets(self, conns: list[Connection]) -> list[tuple[bytes, bytes]]:
+        """(api_key, webhook_secret) encriptados con un solo encrypt_many.
+
+        El webhook_secret vacío se guarda como b"" sin encriptar.
+        """
+        values: list[str] = []
+        for c in conns:
+            values.append(c.odoo_api_key)
+            if c.webhook_secret:
+                values.append(c.webhook_secret)
+        tokens = iter(self._enc.encrypt_many(values))
+        return [(next(tokens), next(tokens) if c.webhook_secret else b"") for c in conns]
+
+    async def create(self, conn: Connection) -> Connection:
+        now = utc_now()
+        [(api_key, webhook_secret)] = self._encrypt_secrets([conn])
+        async with self._pool.transaction() as db:
+            cursor = await db.execute(
+                self._INSERT_SQL, self._insert_row(conn, api_key, webhook_secret, now)
+            )
         conn.id = cursor.lastrowid
         conn.created_at = now
         conn.updated_at = now
         return conn
 
+    async def create_many(self, conns: list[Connection]) -> list[Connection]:
+        """Inserta varias conexiones con un solo executemany y un commit."""
+        if not conns:
+            return conns
+        now = utc_now()
+        rows = [
+            self._insert_row(c, api_key, webhook_secret, now)
+            for c, (api_key, webhook_secret) in zip(conns, self._encrypt_secrets(conns))
+        ]
+        async with self._pool.transaction() as db:
+            await db.executemany(self._INSERT_SQL, rows)
+            # Transacción exclusiva y AUTOINCREMENT: los ids de la tanda son consecutivos
+            cursor = await db.execute("SELECT last_insert_rowid()")
+            row = await cursor.fetchone()
+        first_id = row[0] - len(conns) + 1
+        for i, c in enumerate(conns):
+            c.id = first_id + i
+            c.created_at = now
+            c.updated_at = now
+        return conns
+
     async def update(self, conn: Connection) -> Connection:
-        now = _now()
-        await self._db.execute(
+        now = utc_now()
+        [(api_key, webhook_secret)] = self._encrypt_secrets([conn])
+        await _execute_tx(
+            self._pool,
             """UPDATE connections SET
                name=?, external_id=?, odoo_url=?, odoo_db=?, odoo_username=?, odoo_api_key=?,
                webhook_url=?, webhook_secret=?, poll_interval_seconds=?, enabled=?,
@@ -110,52 +289,69 @@ class ConnectionRepository:
                 conn.odoo_url,
                 conn.odoo_db,
                 conn.odoo_username,
-                self._enc.encrypt(conn.odoo_api_key),
+                api_key,
                 conn.webhook_url,
-                self._enc.encrypt(conn.webhook_secret) if conn.webhook_secret else "",
+                webhook_secret,
                 conn.poll_interval_seconds,
                 int(conn.enabled),
                 now,
                 conn.id,
             ),
         )
-        await self._db.commit()
         conn.updated_at = now
         return conn
 
     async def delete(self, conn_id: int) -> None:
-        await self._db.execute("DELETE FROM connections WHERE id = ?", (conn_id,))
-        await self._db.commit()
+        await _execute_tx(self._pool, "DELETE FROM connections WHERE id = ?", (conn_id,))
 
     async def update_circuit_state(
         self, conn_id: int, state: CircuitState, failure_count: int
     ) -> None:
-        now = _now()
+        now = utc_now()
         last_failure = now if state == CircuitState.OPEN else None
-        await self._db.execute(
+        await _execute_tx(
+            self._pool,
             """UPDATE connections SET
                circuit_state=?, circuit_failure_count=?,
                circuit_last_failure_at=COALESCE(?, circuit_last_failure_at),
                updated_at=?
                WHERE id=?""",
-            (state.value, failure_count, last_failure, now, conn_id),
+            (CIRCUIT_STATE_TO_STR[state], failure_count, last_failure, now, conn_id),
         )
-        await self._db.commit()
 
-    async def update_last_sync(self, conn_id: int, sync_at: str) -> None:
-        await self._db.execute(
-            "UPDATE connections SET last_sync_at=?, updated_at=? WHERE id=?",
-            (sync_at, _now(), conn_id),
+    async def update_cycle_result(
+        self,
+        conn_id: int,
+        state: CircuitState,
+        failure_count: int,
+        last_sync_at: str | None = None,
+    ) -> None:
+        """Cierre de ciclo: circuit breaker y, si avanzó, last_sync_at en un UPDATE."""
+        now = utc_now()
+        last_failure = now if state is CircuitState.OPEN else None
+        await _execute_tx(
+            self._pool,
+            """UPDATE connections SET
+               circuit_state=?, circuit_failure_count=?,
+               circuit_last_failure_at=COALESCE(?, circuit_last_failure_at),
+               last_sync_at=COALESCE(?, last_sync_at),
+               updated_at=?
+               WHERE id=?""",
+            (
+                CIRCUIT_STATE_TO_STR[state],
+                failure_count,
+                last_failure,
+                last_sync_at,
+                now,
+                conn_id,
+            ),
         )
-        await self._db.commit()
-
 
-class SyncLogRepository:
-    def __init__(self, db: aiosqlite.Connection) -> None:
-        self._db = db
 
+class SyncLogRepository(_Repository):
     async def create(self, log: SyncLog) -> SyncLog:
-        cursor = await self._db.execute(
+        cursor = await _execute_tx(
+            self._pool,
             """INSERT INTO sync_logs
                (connection_id, started_at, finished_at, orders_found,
                 orders_sent, orders_failed, orders_skipped, error_message)
@@ -171,101 +367,145 @@ class SyncLogRepository:
                 log.error_message,
             ),
         )
-        await self._db.commit()
         log.id = cursor.lastrowid
         return log
 
     async def list_by_connection(
         self, connection_id: int, limit: int = 50
     ) -> list[SyncLog]:
-        cursor = await self._db.execute(
-            """SELECT * FROM sync_logs
-               WHERE connection_id = ?
-               ORDER BY id DESC LIMIT ?""",
+        return await _read_all(
+            self._pool,
+            f"""SELECT {_SYNC_LOG_COLUMNS} FROM sync_logs
+                WHERE connection_id = ?
+                ORDER BY id DESC LIMIT ?""",
             (connection_id, limit),
+            row_factory=_sync_log_from_row,
+        )
+
+    async def list_recent(self, limit: int = 50) -> list[SyncLog]:
+        return await _read_all(
+            self._pool,
+            f"SELECT {_SYNC_LOG_COLUMNS} FROM sync_logs ORDER BY id DESC LIMIT ?",
+            (limit,),
+            row_factory=_sync_log_from_row,
         )
-        rows = await cursor.fetchall()
-        return [
-            SyncLog(
-                id=r["id"],
-                connection_id=r["connection_id"],
-                started_at=r["started_at"],
-                finished_at=r["finished_at"],
-                orders_found=r["orders_found"],
-                orders_sent=r["orders_sent"],
-                orders_failed=r["orders_failed"],
-                orders_skipped=r["orders_skipped"],
-                error_message=r["error_message"],
-            )
-            for r in rows
-        ]
 
     async def trim_to_limit(self, connection_id: int, limit: int = 100) -> None:
-        await self._db.execute(
-            """DELETE FROM sync_logs WHERE connection_id = ? AND id NOT IN (
+        await _execute_tx(
+            self._pool,
+            """DELETE FROM sync_logs WHERE connection_id = ? AND id < (
                    SELECT id FROM sync_logs WHERE connection_id = ?
-                   ORDER BY id DESC LIMIT ?
+                   ORDER BY id DESC LIMIT 1 OFFSET ?
                )""",
-            (connection_id, connection_id, limit),
+            (connection_id, connection_id, limit - 1),
         )
-        await self._db.commit()
-
 
-class RetryQueueRepository:
-    def __init__(self, db: aiosqlite.Connection) -> None:
-        self._db = db
 
+class RetryQueueRepository(_Repository):
     async def enqueue(self, item: RetryItem) -> RetryItem:
-        now = _now()
-        cursor = await self._db.execute(
+        now = utc_now()
+        cursor = await _execute_tx(
+            self._pool,
             """INSERT INTO retry_queue
                (connection_id, odoo_order_id, odoo_order_name, payload,
                 status, attempts, max_attempts, next_retry_at,
-                last_error, created_at, updated_at)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                last_error, created_at, updated_at, odoo_write_date)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
             (
                 item.connection_id,
                 item.odoo_order_id,
                 item.odoo_order_name,
                 item.payload,
-                item.status.value,
+                RETRY_STATUS_TO_STR[item.status],
                 item.attempts,
                 item.max_attempts,
                 item.next_retry_at,
                 item.last_error,
                 now,
                 now,
+                item.odoo_write_date,
             ),
         )
-        await self._db.commit()
         item.id = cursor.lastrowid
         return item
 
+    async def enqueue_many(self, items: list[RetryItem]) -> None:
+        if not items:
+            return
+        now = utc_now()
+        await _executemany_tx(
+            self._pool,
+            """INSERT INTO retry_queue
+               (connection_id, odoo_order_id, odoo_order_name, payload,
+                status, attempts, max_attempts, next_retry_at,
+                last_error, created_at, updated_at, odoo_write_date)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            [
+                (
+                    item.connection_id,
+                    item.odoo_order_id,
+                    item.odoo_order_name,
+                    item.payload,
+                    RETRY_STATUS_TO_STR[item.status],
+                    item.attempts,
+                    item.max_attempts,
+                    item.next_retry_at,
+                    item.last_error,
+                    now,
+                    now,
+                    item.odoo_write_date,
+                )
+                for item in items
+            ],
+        )
+
     async def get_pending(
         self, connection_id: int, now: str | None = None
     ) -> list[RetryItem]:
         if now is None:
-            now = _now()
-        cursor = await self._db.execute(
-            """SELECT * FROM retry_queue
-               WHERE connection_id = ? AND status = 'pending' AND next_retry_at <= ?
-               ORDER BY next_retry_at""",
+            now = utc_now()
+        return await _read_all(
+            self._pool,
+            f"""SELECT {_RETRY_ITEM_COLUMNS} FROM retry_queue
+                WHERE connection_id = ? AND status = 'pending' AND next_retry_at <= ?
+                ORDER BY next_retry_at""",
             (connection_id, now),
+            row_factory=_retry_item_from_row,
         )
-        rows = await cursor.fetchall()
-        return [self._row_to_model(r) for r in rows]
 
     async def list_by_connection(
         self, connection_id: int, limit: int = 100
     ) -> list[RetryItem]:
-        cursor = await self._db.execute(
-            """SELECT * FROM retry_queue
-               WHERE connection_id = ?
-               ORDER BY id DESC LIMIT ?""",
+        return await _read_all(
+            self._pool,
+            f"""SELECT {_RETRY_ITEM_COLUMNS} FROM retry_queue
+                WHERE connection_id = ?
+                ORDER BY id DESC LIMIT ?""",
             (connection_id, limit),
+            row_factory=_retry_item_from_row,
+        )
+
+    async def list_by_connections(
+        self, connection_ids: list[int], limit: int = 100
+    ) -> list[RetryItem]:
+        """Últimos `limit` items de cada conexión, en una sola query."""
+        if not connection_ids:
+            return []
+        placeholders = ",".join("?" * len(connection_ids))
+        return await _read_all(
+            self._pool,
+            f"""SELECT {_RETRY_ITEM_COLUMNS} FROM (
+                    SELECT *, ROW_NUMBER() OVER (
+                        PARTITION BY connection_id ORDER BY id DESC
+                    ) AS rn
+                    FROM retry_queue
+                    WHERE connection_id IN ({placeholders})
+                )
+                WHERE rn <= ?
+                ORDER BY id DESC""",
+            (*connection_ids, limit),
+            row_factory=_retry_item_from_row,
         )
-        rows = await cursor.fetchall()
-        return [self._row_to_model(r) for r in rows]
 
     async def update_status(
         self,
@@ -275,8 +515,9 @@ class RetryQueueRepository:
         next_retry_at: str | None = None,
         last_error: str | None = None,
     ) -> None:
-        now = _now()
-        await self._db.execute(
+        now = utc_now()
+        await _execute_tx(
+            self._pool,
             """UPDATE retry_queue SET
                status=?,
                attempts=COALESCE(?, attempts),
@@ -284,108 +525,187 @@ class RetryQueueRepository:
                last_error=COALESCE(?, last_error),
                updated_at=?
                WHERE id=?""",
-            (status.value, attempts, next_retry_at, last_error, now, item_id),
+            (RETRY_STATUS_TO_STR[status], attempts, next_retry_at, last_error, now, item_id),
+        )
+
+    async def update_many(self, items: list[RetryItem]) -> None:
+        """Persiste status, attempts, next_retry_at y last_error de cada item."""
+        if not items:
+            return
+        now = utc_now()
+        await _executemany_tx(
+            self._pool,
+            """UPDATE retry_queue SET
+               status=?, attempts=?, next_retry_at=?, last_error=?, updated_at=?
+               WHERE id=?""",
+            [
+                (
+                    RETRY_STATUS_TO_STR[item.status],
+                    item.attempts,
+                    item.next_retry_at,
+                    item.last_error,
+                    now,
+                    item.id,
+                )
+                for item in items
+            ],
         )
-        await self._db.commit()
 
     async def get_summary(self, connection_id: int) -> dict[str, int]:
-        cursor = await self._db.execute(
-            """SELECT status, COUNT(*) as cnt FROM retry_queue
+        rows = await _read_all(
+            self._pool,
+            """SELECT status, COUNT(*) FROM retry_queue
                WHERE connection_id = ? GROUP BY status""",
             (connection_id,),
         )
-        rows = await cursor.fetchall()
-        return {r["status"]: r["cnt"] for r in rows}
+        return {r[0]: r[1] for r in rows}
 
     async def cleanup_finished(self, connection_id: int) -> None:
-        await self._db.execute(
+        await _execute_tx(
+            self._pool,
             "DELETE FROM retry_queue WHERE connection_id = ? AND status IN ('sent', 'discarded')",
             (connection_id,),
         )
-        await self._db.commit()
-
-    def _row_to_model(self, row: aiosqlite.Row) -> RetryItem:
-        return RetryItem(
-            id=row["id"],
-            connection_id=row["connection_id"],
-            odoo_order_id=row["odoo_order_id"],
-            odoo_order_name=row["odoo_order_name"],
-            payload=row["payload"],
-            status=RetryStatus(row["status"]),
-            attempts=row["attempts"],
-            max_attempts=row["max_attempts"],
-            next_retry_at=row["next_retry_at"],
-            last_error=row["last_error"],
-            created_at=row["created_at"],
-            updated_at=row["updated_at"],
-        )
 
 
-class SentOrderRepository:
-    def __init__(self, db: aiosqlite.Connection) -> None:
-        self._db = db
-
-    async def mark_sent(self, order: SentOrder) -> None:
-        await self._db.execute(
-            """INSERT OR IGNORE INTO sent_orders
-               (connection_id, odoo_order_id, odoo_order_name, odoo_write_date, sent_at)
-               VALUES (?, ?, ?, ?, ?)""",
-            (
-                order.connection_id,
-                order.odoo_order_id,
-                order.odoo_order_name,
-                order.odoo_write_date,
-                order.sent_at or _now(),
-            ),
-        )
-        await self._db.commit()
+_SentKey = tuple[int, int, str]
+
+
+class SentOrderRepository(_Repository):
+    # Claves (connection_id, odoo_order_id, odoo_write_date) registradas
+    # recientemente por este proceso; evitan volver a SQLite en el dedup.
+    RECENT_CACHE_SIZE = 1024
+
+    def __init__(self, db: aiosqlite.Connection | DbPool) -> None:
+        super().__init__(db)
+        self._recent: OrderedDict[_SentKey, None] = OrderedDict()
+
+    def _remember(self, keys: list[_SentKey]) -> None:
+        for key in keys:
+            self._recent[key] = None
+            self._recent.move_to_end(key)
+        while len(self._recent) > self.RECENT_CACHE_SIZE:
+            self._recent.popitem(last=False)
+
+    async def mark_sent(self, order: SentOrder) -> bool:
+        """Registra la orden; retorna False si ya estaba registrada."""
+        async with self._pool.transaction() as db:
+            cursor = await db.execute(
+                """INSERT INTO sent_orders
+                   (connection_id, odoo_order_id, odoo_order_name, odoo_write_date, sent_at)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(connection_id, odoo_order_id, odoo_write_date) DO NOTHING
+                   RETURNING id""",
+                (
+                    order.connection_id,
+                    order.odoo_order_id,
+                    order.odoo_order_name,
+                    order.odoo_write_date,
+                    order.sent_at or utc_now(),
+                ),
+            )
+            row = await cursor.fetchone()
+            self._pool.after_commit(
+                partial(
+                    self._remember,
+                    [(order.connection_id, order.odoo_order_id, order.odoo_write_date)],
+                )
+            )
+        if row is None:
+            return False
+        order.id = row[0]
+        return True
+
+    async def bulk_mark_sent(self, orders: list[SentOrder]) -> None:
+        if not orders:
+            return
+        now = utc_now()
+        async with self._pool.transaction() as db:
+            await db.executemany(
+                """INSERT INTO sent_orders
+                   (connection_id, odoo_order_id, odoo_order_name, odoo_write_date, sent_at)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(connection_id, odoo_order_id, odoo_write_date) DO NOTHING""",
+                [
+                    (
+                        o.connection_id,
+                        o.odoo_order_id,
+                        o.odoo_order_name,
+                        o.odoo_write_date,
+                        o.sent_at or now,
+                    )
+                    for o in orders
+                ],
+            )
+            # Al cache solo lo confirmado: un rollback (también de una
+            # transacción externa) no deja órdenes marcadas como enviadas
+            self._pool.after_commit(
+                partial(
+                    self._remember,
+                    [(o.connection_id, o.odoo_order_id, o.odoo_write_date) for o in orders],
+                )
+            )
 
     async def is_sent(
         self, connection_id: int, odoo_order_id: int, write_date: str
     ) -> bool:
-        cursor = await self._db.execute(
+        if (connection_id, odoo_order_id, write_date) in self._recent:
+            return True
+        row = await _read_one(
+            self._pool,
             """SELECT 1 FROM sent_orders
                WHERE connection_id = ? AND odoo_order_id = ? AND odoo_write_date = ?""",
             (connection_id, odoo_order_id, write_date),
         )
-        return await cursor.fetchone() is not None
+        return row is not None
+
+    async def filter_sent(
+        self, connection_id: int, keys: list[tuple[int, str]]
+    ) -> set[tuple[int, str]]:
+        """Retorna el subconjunto de `(odoo_order_id, write_date)` ya registrado."""
+        found = {k for k in keys if (connection_id, *k) in self._recent}
+        missing = {order_id for order_id, wd in keys if (order_id, wd) not in found}
+        if not missing:
+            return found
+        placeholders = ",".join("?" * len(missing))
+        rows = await _read_all(
+            self._pool,
+            f"""SELECT odoo_order_id, odoo_write_date FROM sent_orders
+                WHERE connection_id = ? AND odoo_order_id IN ({placeholders})""",
+            (connection_id, *missing),
+        )
+        wanted = set(keys)
+        found.update(k for k in ((r[0], r[1]) for r in rows) if k in wanted)
+        return found
 
     async def get_sent_ids(self, connection_id: int) -> set[tuple[int, str]]:
-        cursor = await self._db.execute(
+        rows = await _read_all(
+            self._pool,
             "SELECT odoo_order_id, odoo_write_date FROM sent_orders WHERE connection_id = ?",
             (connection_id,),
         )
-        rows = await cursor.fetchall()
-        return {(r["odoo_order_id"], r["odoo_write_date"]) for r in rows}
+        return {(r[0], r[1]) for r in rows}
 
     async def list_by_connection(
         self, connection_id: int, limit: int = 30
     ) -> list[SentOrder]:
-        cursor = await self._db.execute(
-            """SELECT * FROM sent_orders
-               WHERE connection_id = ?
-               ORDER BY sent_at DESC LIMIT ?""",
+        return await _read_all(
+            self._pool,
+            f"""SELECT {_SENT_ORDER_COLUMNS} FROM sent_orders
+                WHERE connection_id = ?
+                ORDER BY sent_at DESC LIMIT ?""",
             (connection_id, limit),
+            row_factory=_sent_order_from_row,
         )
-        rows = await cursor.fetchall()
-        return [
-            SentOrder(
-                id=r["id"],
-                connection_id=r["connection_id"],
-                odoo_order_id=r["odoo_order_id"],
-                odoo_order_name=r["odoo_order_name"],
-                odoo_write_date=r["odoo_write_date"],
-                sent_at=r["sent_at"],
-            )
-            for r in rows
-        ]
 
     async def trim_to_limit(self, connection_id: int, limit: int = 30) -> None:
-        await self._db.execute(
-            """DELETE FROM sent_orders WHERE connection_id = ? AND id NOT IN (
-                   SELECT id FROM sent_orders WHERE connection_id = ?
-                   ORDER BY sent_at DESC LIMIT ?
+        # Corte = fila número `limit`; si hay menos filas el subquery es NULL
+        # y no se borra nada
+        await _execute_tx(
+            self._pool,
+            """DELETE FROM sent_orders WHERE connection_id = ? AND (sent_at, id) < (
+                   SELECT sent_at, id FROM sent_orders WHERE connection_id = ?
+                   ORDER BY sent_at DESC, id DESC LIMIT 1 OFFSET ?
                )""",
-            (connection_id, connection_id, limit),
+            (connection_id, connection_id, limit - 1),
         )
-        await self._db.commit()
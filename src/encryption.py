@@ -1,14 +1,71 @@
 from __future__ import annotations
 
+import base64
+import os
+from collections import OrderedDict
+
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.hashes import SHA256
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+# Token AES-GCM: versión (1 byte) + nonce (12 bytes) + ciphertext + tag.
+# Los tokens Fernet empiezan siempre con 0x80 en base64 ("gAAAA...").
+_AEAD_VERSION = b"\x01"
+_NONCE_SIZE = 12
+_HEADER_SIZE = len(_AEAD_VERSION) + _NONCE_SIZE
 
 
 class FieldEncryptor:
+    """Encripta campos en claro (str) con AES-256-GCM (bytes, columnas BLOB).
+
+    La clave sigue siendo una clave Fernet; los tokens Fernet ya guardados se
+    desencriptan igual y se reemplazan al volver a escribir la conexión.
+    """
+
+    # Los poll loops releen la misma conexión en cada ciclo: el token solo
+    # cambia al editarla, así que se cachea el texto plano por token
+    DECRYPT_CACHE_SIZE = 4096
+
     def __init__(self, key: str) -> None:
-        self._fernet = Fernet(key.encode() if isinstance(key, str) else key)
+        key_bytes = key.encode() if isinstance(key, str) else key
+        self._fernet = Fernet(key_bytes)
+        aead_key = HKDF(
+            algorithm=SHA256(), length=32, salt=None, info=b"field-encryptor/aes-gcm"
+        ).derive(base64.urlsafe_b64decode(key_bytes))
+        self._aead = AESGCM(aead_key)
+        self._plain: OrderedDict[bytes | str, str] = OrderedDict()
+
+    def encrypt(self, plaintext: str) -> bytes:
+        nonce = os.urandom(_NONCE_SIZE)
+        return _AEAD_VERSION + nonce + self._aead.encrypt(nonce, plaintext.encode(), None)
+
+    def decrypt(self, token: bytes | str) -> str:
+        plaintext = self._plain.get(token)
+        if plaintext is not None:
+            self._plain.move_to_end(token)
+            return plaintext
+        if isinstance(token, bytes) and token[:1] == _AEAD_VERSION:
+            plaintext = self._aead.decrypt(
+                token[1:_HEADER_SIZE], token[_HEADER_SIZE:], None
+            ).decode()
+        else:
+            plaintext = self._fernet.decrypt(token).decode()
+        self._plain[token] = plaintext
+        if len(self._plain) > self.DECRYPT_CACHE_SIZE:
+            self._plain.popitem(last=False)
+        return plaintext
 
-    def encrypt(self, plaintext: str) -> str:
-        return self._fernet.encrypt(plaintext.encode()).decode()
+    def encrypt_many(self, plaintexts: list[str]) -> list[bytes]:
+        # Un solo os.urandom para todos los nonces y el AESGCM ya inicializado
+        # (la clave se expande una vez en __init__)
+        aead_encrypt = self._aead.encrypt
+        nonces = os.urandom(_NONCE_SIZE * len(plaintexts))
+        tokens = []
+        for i, plaintext in enumerate(plaintexts):
+            nonce = nonces[i * _NONCE_SIZE : (i + 1) * _NONCE_SIZE]
+            tokens.append(_AEAD_VERSION + nonce + aead_encrypt(nonce, plaintext.encode(), None))
+        return tokens
 
-    def decrypt(self, ciphertext: str) -> str:
-        return self._fernet.decrypt(ciphertext.encode()).decode()
+    def decrypt_many(self, tokens: list[bytes | str]) -> list[str]:
+        return [self.decrypt(t) for t in tokens]
@@ -1,13 +1,27 @@
 from __future__ import annotations
 
 import logging
-from typing import Any
+from typing import Any, Sequence
 
 import httpx
+import orjson
 
 logger = logging.getLogger(__name__)
 
 TIMEOUT = 30.0
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# HTTP/2 multiplexa los reads concurrentes de fetch_batch_data sobre una
+# sola conexión TLS; con HTTP/1.1 el pool abre una conexión por request
+LIMITS = httpx.Limits(
+    max_connections=32, max_keepalive_connections=16, keepalive_expiry=60.0
+)
+
+
+def new_http_client(limits: httpx.Limits = LIMITS) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=True, timeout=httpx.Timeout(TIMEOUT, connect=5.0), limits=limits
+    )
 
 
 class OdooAuthError(Exception):
@@ -36,7 +50,7 @@ class OdooClient:
         self._username = username
         self._api_key = api_key
         self._uid: int | None = None
-        self._http = http_client or httpx.AsyncClient(timeout=TIMEOUT)
+        self._http = http_client or new_http_client()
         self._owns_http = http_client is None
 
     @property
@@ -63,8 +77,8 @@ class OdooClient:
     async def search_read(
         self,
         model: str,
-        domain: list,
-        fields: list[str],
+        domain: Sequence,
+        fields: Sequence[str],
         limit: int = 0,
         order: str = "",
     ) -> list[dict[str, Any]]:
@@ -116,13 +130,15 @@ class OdooClient:
 
     async def _rpc_call(self, payload: dict) -> Any:
         url = f"{self._url}/jsonrpc"
-        response = await self._http.post(url, json=payload)
+        response = await self._http.post(
+            url, content=orjson.dumps(payload), headers=_JSON_HEADERS
+        )
 
         if response.status_code == 429:
             raise OdooRateLimitError("HTTP 429: Rate limit alcanzado")
         response.raise_for_status()
 
-        data = response.json()
+        data = orjson.loads(response.content)
         if "error" in data:
             error = data["error"]
             msg = error.get("data", {}).get("message", error.get("message", str(error)))
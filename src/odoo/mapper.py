@@ -1,153 +1,197 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+from collections import defaultdict
 from dataclasses import dataclass, field
-from typing import Any
+from typing import Any, Callable
 
 from src.odoo.client import OdooClient
 
 logger = logging.getLogger(__name__)
 
-
-@dataclass
+_LINE_FIELDS = [
+    "order_id",
+    "product_id",
+    "product_template_id",
+    "product_uom_qty",
+    "price_unit",
+    "price_subtotal",
+    "price_total",
+    "discount",
+    "name",
+]
+_PARTNER_FIELDS = [
+    "name",
+    "email",
+    "phone",
+    "street",
+    "street2",
+    "city",
+    "state_id",
+    "zip",
+    "country_id",
+    "vat",
+]
+_PRODUCT_FIELDS = ["name", "default_code", "barcode", "product_tmpl_id"]
+_TEMPLATE_FIELDS = ["name", "default_code"]
+
+
+@dataclass(slots=True)
 class BatchOdooData:
     partners: dict[int, dict] = field(default_factory=dict)
     products: dict[int, dict] = field(default_factory=dict)
     variants: dict[int, dict] = field(default_factory=dict)
+    # Solo lines con cantidad != 0 (ver index_lines)
+    lines_by_order: dict[int, list[dict]] = field(default_factory=dict)
 
 
 async def fetch_batch_data(
     client: OdooClient, orders: list[dict[str, Any]]
 ) -> BatchOdooData:
     partner_ids: set[int] = set()
-    line_product_ids: set[int] = set()
-
     for order in orders:
         if order.get("partner_id"):
-            pid = order["partner_id"]
-            partner_ids.add(pid[0] if isinstance(pid, (list, tuple)) else pid)
+            partner_ids.add(_extract_id(order["partner_id"]))
 
         if order.get("partner_shipping_id"):
-            sid = order["partner_shipping_id"]
-            partner_ids.add(sid[0] if isinstance(sid, (list, tuple)) else sid)
-
-    all_lines: list[dict] = []
-    order_ids = [o["id"] for o in orders]
-    if order_ids:
-        all_lines = await client.search_read(
-            "sale.order.line",
-            [["order_id", "in", order_ids]],
-            [
-                "order_id",
-                "product_id",
-                "product_template_id",
-                "product_uom_qty",
-                "price_unit",
-                "price_subtotal",
-                "price_total",
-                "discount",
-                "name",
-            ],
-        )
-
-    for line in all_lines:
-        if line.get("product_id"):
-            pid = line["product_id"]
-            line_product_ids.add(pid[0] if isinstance(pid, (list, tuple)) else pid)
+            partner_ids.add(_extract_id(order["partner_shipping_id"]))
 
+    # Partners solo dependen de las órdenes: se piden en paralelo con la
+    # cadena lines → productos/templates
     batch = BatchOdooData()
+    _, all_lines = await asyncio.gather(
+        _fetch_partners(client, batch, partner_ids),
+        _fetch_lines_and_products(client, batch, [o["id"] for o in orders]),
+    )
+
+    batch.lines_by_order = index_lines(all_lines)
+    return batch
 
+
+def index_lines(lines: list[dict]) -> dict[int, list[dict]]:
+    """Agrupa las lines por order_id, descartando las de cantidad 0.
+
+    El filtro se aplica una vez al armar el batch: el mapper recorre solo
+    lines que van al payload.
+    """
+    lines_by_order: defaultdict[int, list[dict]] = defaultdict(list)
+    for line in lines:
+        if line.get("product_uom_qty", 0) != 0:
+            lines_by_order[_extract_id(line["order_id"])].append(line)
+    return dict(lines_by_order)
+
+
+async def _fetch_partners(
+    client: OdooClient, batch: BatchOdooData, partner_ids: set[int]
+) -> None:
     if partner_ids:
-        partners_data = await client.read(
-            "res.partner",
-            list(partner_ids),
-            [
-                "name",
-                "email",
-                "phone",
-                "street",
-                "street2",
-                "city",
-                "state_id",
-                "zip",
-                "country_id",
-                "vat",
-            ],
-        )
+        partners_data = await client.read("res.partner", list(partner_ids), _PARTNER_FIELDS)
         batch.partners = {p["id"]: p for p in partners_data}
 
+
+async def _fetch_lines_and_products(
+    client: OdooClient, batch: BatchOdooData, order_ids: list[int]
+) -> list[dict]:
+    if not order_ids:
+        return []
+    all_lines = await client.search_read(
+        "sale.order.line", [["order_id", "in", order_ids]], _LINE_FIELDS
+    )
+
+    # La línea ya trae product_template_id: los templates se piden junto con
+    # los productos en vez de esperar la respuesta de product.product
+    line_product_ids: set[int] = set()
+    line_tmpl_ids: set[int] = set()
+    for line in all_lines:
+        if line.get("product_id"):
+            line_product_ids.add(_extract_id(line["product_id"]))
+        if line.get("product_template_id"):
+            line_tmpl_ids.add(_extract_id(line["product_template_id"]))
+
     if line_product_ids:
-        products_data = await client.read(
-            "product.product",
-            list(line_product_ids),
-            ["name", "default_code", "barcode", "product_tmpl_id"],
+        products_data, templates_data = await asyncio.gather(
+            client.read("product.product", list(line_product_ids), _PRODUCT_FIELDS),
+            client.read("product.template", list(line_tmpl_ids), _TEMPLATE_FIELDS),
         )
         batch.products = {p["id"]: p for p in products_data}
-
-        tmpl_ids = set()
-        for p in products_data:
-            if p.get("product_tmpl_id"):
-                tid = p["product_tmpl_id"]
-                tmpl_ids.add(tid[0] if isinstance(tid, (list, tuple)) else tid)
-
-        if tmpl_ids:
+        batch.variants = {t["id"]: t for t in templates_data}
+
+        missing_tmpl_ids = {
+            _extract_id(p["product_tmpl_id"])
+            for p in products_data
+            if p.get("product_tmpl_id")
+        } - batch.variants.keys()
+        if missing_tmpl_ids:
             templates_data = await client.read(
-                "product.template",
-                list(tmpl_ids),
-                ["name", "default_code"],
+                "product.template", list(missing_tmpl_ids), _TEMPLATE_FIELDS
             )
-            batch.variants = {t["id"]: t for t in templates_data}
+            batch.variants.update((t["id"], t) for t in templates_data)
 
-    # Indexar lines por order_id
-    lines_by_order: dict[int, list[dict]] = {}
-    for line in all_lines:
-        oid = line["order_id"]
-        oid = oid[0] if isinstance(oid, (list, tuple)) else oid
-        lines_by_order.setdefault(oid, []).append(line)
-
-    # Guardar lines indexadas para uso posterior
-    batch._lines_by_order = lines_by_order  # type: ignore[attr-defined]
-
-    return batch
+    return all_lines
 
 
 def _extract_id(val: Any) -> int | None:
-    if isinstance(val, (list, tuple)) and val:
-        return val[0]
-    if isinstance(val, int) and val:
+    # Many2one de JSON-RPC: [id, name] o False. `type() is` evita el isinstance
+    t = type(val)
+    if t is list or t is tuple:
+        return val[0] if val else None
+    if t is int and val:
         return val
     return None
 
 
+def _m2o_name(val: Any) -> str:
+    t = type(val)
+    return val[1] if (t is list or t is tuple) and len(val) > 1 else ""
+
+
 def _format_partner(partner: dict | None) -> dict:
     if not partner:
         return {}
-    state = partner.get("state_id")
-    country = partner.get("country_id")
+    get = partner.get
     return {
-        "name": partner.get("name", ""),
-        "email": partner.get("email") or "",
-        "phone": partner.get("phone") or "",
-        "tax_id": partner.get("vat") or "",
+        "name": get("name", ""),
+        "email": get("email") or "",
+        "phone": get("phone") or "",
+        "tax_id": get("vat") or "",
         "address": {
-            "street": partner.get("street") or "",
-            "street2": partner.get("street2") or "",
-            "city": partner.get("city") or "",
-            "state": state[1] if isinstance(state, (list, tuple)) and state else "",
-            "zip": partner.get("zip") or "",
-            "country": country[1] if isinstance(country, (list, tuple)) and country else "",
+            "street": get("street") or "",
+            "street2": get("street2") or "",
+            "city": get("city") or "",
+            "state": _m2o_name(get("state_id")),
+            "zip": get("zip") or "",
+            "country": _m2o_name(get("country_id")),
         },
     }
 
 
-def _resolve_sku(product: dict | None, template: dict | None, odoo_db: str, product_id: int) -> str:
-    if product and product.get("default_code"):
-        return product["default_code"]
-    if product and product.get("barcode"):
-        return product["barcode"]
-    if template and template.get("default_code"):
-        return template["default_code"]
-    return f"ODOO-{odoo_db}-{product_id}"
+def _map_line(
+    line: dict,
+    products_get: Callable[[int | None], dict | None],
+    variants_get: Callable[[int | None], dict | None],
+    sku_prefix: str,
+) -> dict:
+    prod_id = _extract_id(line.get("product_id"))
+    product = products_get(prod_id)
+    template = variants_get(_extract_id(product.get("product_tmpl_id"))) if product else None
+
+    # SKU: default_code → barcode → default_code del template → id sintético
+    sku = (
+        (product and (product.get("default_code") or product.get("barcode")))
+        or (template and template.get("default_code"))
+        or f"{sku_prefix}{prod_id or 0}"
+    )
+    return {
+        "sku": sku,
+        "name": line.get("name", ""),
+        "quantity": line["product_uom_qty"],
+        "unit_price": line.get("price_unit", 0),
+        "subtotal": line.get("price_subtotal", 0),
+        "total": line.get("price_total", 0),
+        "discount_percent": line.get("discount", 0),
+        "odoo_product_id": prod_id,
+    }
 
 
 def map_order_to_webhook_payload(
@@ -160,37 +204,19 @@ def map_order_to_webhook_payload(
     shipping_id = _extract_id(order.get("partner_shipping_id"))
 
     customer = _format_partner(batch.partners.get(partner_id) if partner_id else None)
-    shipping = _format_partner(batch.partners.get(shipping_id) if shipping_id else None)
-
-    lines: list[dict] = getattr(batch, "_lines_by_order", {}).get(order["id"], [])
-    items = []
-    for line in lines:
-        qty = line.get("product_uom_qty", 0)
-        if qty == 0:
-            continue
-
-        prod_id = _extract_id(line.get("product_id"))
-        product = batch.products.get(prod_id) if prod_id else None
-
-        tmpl_id = None
-        if product and product.get("product_tmpl_id"):
-            tmpl_id = _extract_id(product["product_tmpl_id"])
-        template = batch.variants.get(tmpl_id) if tmpl_id else None
-
-        sku = _resolve_sku(product, template, odoo_db, prod_id or 0)
-
-        items.append(
-            {
-                "sku": sku,
-                "name": line.get("name", ""),
-                "quantity": qty,
-                "unit_price": line.get("price_unit", 0),
-                "subtotal": line.get("price_subtotal", 0),
-                "total": line.get("price_total", 0),
-                "discount_percent": line.get("discount", 0),
-                "odoo_product_id": prod_id,
-            }
-        )
+    # Es común que la dirección de envío sea el mismo partner que el cliente
+    if shipping_id == partner_id:
+        shipping = customer
+    else:
+        shipping = _format_partner(batch.partners.get(shipping_id) if shipping_id else None)
+
+    lines = batch.lines_by_order.get(order["id"], [])
+    # .get ligados una vez por orden, no por línea
+    products_get = batch.products.get
+    variants_get = batch.variants.get
+    # El prefijo del SKU sintético solo depende de la base: uno por orden
+    sku_prefix = f"ODOO-{odoo_db}-"
+    items = [_map_line(line, products_get, variants_get, sku_prefix) for line in lines]
 
     return {
         "source": "odoo",
@@ -205,16 +231,10 @@ def map_order_to_webhook_payload(
             "amount_untaxed": order.get("amount_untaxed", 0),
             "amount_tax": order.get("amount_tax", 0),
             "amount_total": order.get("amount_total", 0),
-            "currency": _extract_name(order.get("currency_id")),
+            "currency": _m2o_name(order.get("currency_id")),
             "note": order.get("note") or "",
         },
         "customer": customer,
         "shipping_address": shipping if shipping else customer,
         "items": items,
     }
-
-
-def _extract_name(val: Any) -> str:
-    if isinstance(val, (list, tuple)) and len(val) > 1:
-        return val[1]
-    return ""
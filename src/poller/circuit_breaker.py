@@ -19,14 +19,15 @@ class CircuitBreaker:
         self._state = CircuitState.CLOSED
         self._failure_count = 0
         self._success_count = 0
-        self._last_failure_time: float = 0.0
+        # Instante (monotonic) desde el que OPEN pasa a HALF_OPEN
+        self._recovery_at: float = 0.0
 
     @property
     def state(self) -> CircuitState:
-        if self._state == CircuitState.OPEN:
-            if time.monotonic() - self._last_failure_time >= self._config.recovery_timeout:
-                self._state = CircuitState.HALF_OPEN
-                self._success_count = 0
+        # Solo OPEN depende del reloj; CLOSED/HALF_OPEN no leen monotonic()
+        if self._state is CircuitState.OPEN and time.monotonic() >= self._recovery_at:
+            self._state = CircuitState.HALF_OPEN
+            self._success_count = 0
         return self._state
 
     @property
@@ -34,37 +35,41 @@ class CircuitBreaker:
         return self._failure_count
 
     def check_allowed(self) -> bool:
-        current = self.state
-        return current in (CircuitState.CLOSED, CircuitState.HALF_OPEN)
+        return self._state is not CircuitState.OPEN or self.state is not CircuitState.OPEN
 
     def record_success(self) -> None:
-        if self._state == CircuitState.HALF_OPEN:
+        if self._state is CircuitState.HALF_OPEN:
             self._success_count += 1
             if self._success_count >= self._config.success_threshold:
                 self._state = CircuitState.CLOSED
                 self._failure_count = 0
                 self._success_count = 0
-        elif self._state == CircuitState.CLOSED:
+        elif self._state is CircuitState.CLOSED:
             self._failure_count = 0
 
     def record_failure(self) -> None:
         self._failure_count += 1
-        self._last_failure_time = time.monotonic()
 
-        if self._state == CircuitState.HALF_OPEN:
-            self._state = CircuitState.OPEN
-        elif self._state == CircuitState.CLOSED:
+        if self._state is CircuitState.HALF_OPEN:
+            self._open()
+        elif self._state is CircuitState.CLOSED:
             if self._failure_count >= self._config.failure_threshold:
-                self._state = CircuitState.OPEN
+                self._open()
+        else:
+            self._recovery_at = time.monotonic() + self._config.recovery_timeout
+
+    def _open(self) -> None:
+        self._state = CircuitState.OPEN
+        self._recovery_at = time.monotonic() + self._config.recovery_timeout
 
     def reset(self) -> None:
         self._state = CircuitState.CLOSED
         self._failure_count = 0
         self._success_count = 0
-        self._last_failure_time = 0.0
+        self._recovery_at = 0.0
 
     def load_state(self, state: CircuitState, failure_count: int) -> None:
         self._state = state
         self._failure_count = failure_count
-        if state == CircuitState.OPEN:
-            self._last_failure_time = time.monotonic()
+        if state is CircuitState.OPEN:
+            self._recovery_at = time.monotonic() + self._config.recovery_timeout
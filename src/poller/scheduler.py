@@ -1,7 +1,9 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
 import logging
+import math
 from typing import Any, Callable, Awaitable
 
 import httpx
@@ -14,10 +16,15 @@ from src.db.repositories import (
     SyncLogRepository,
 )
 from src.encryption import FieldEncryptor
-from src.odoo.client import OdooClient
+from src.odoo.client import OdooClient, new_http_client
 from src.poller.circuit_breaker import CircuitBreaker
 from src.poller.sender import WebhookSender
-from src.poller.worker import PollWorker
+from src.poller.worker import (
+    JANITOR_INTERVAL_SECONDS,
+    MAX_SENT_ORDERS,
+    MAX_SYNC_LOGS,
+    PollWorker,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -25,11 +32,37 @@ OnSyncComplete = Callable[[int, SyncLog | None], Awaitable[None]]
 OnCircuitStateChange = Callable[[int, CircuitState], Awaitable[None]]
 
 
+# Un solo cliente HTTP para todas las conexiones: reutiliza TCP/TLS y
+# multiplexa (HTTP/2) las requests hacia hosts compartidos
+SHARED_LIMITS = httpx.Limits(
+    max_connections=100, max_keepalive_connections=50, keepalive_expiry=60.0
+)
+
+# Conexiones sin actividad alargan su intervalo ×IDLE_BACKOFF_FACTOR por ciclo
+# ocioso, hasta MAX_POLL_INTERVAL_SECONDS (o su propio intervalo si es mayor)
+IDLE_BACKOFF_FACTOR = 1.5
+MAX_POLL_INTERVAL_SECONDS = 300
+# Ciclos ociosos a partir de los cuales cualquier intervalo (>= 1s) ya llegó
+# al tope; el contador no pasa de acá y la potencia nunca desborda
+MAX_IDLE_CYCLES = math.ceil(math.log(MAX_POLL_INTERVAL_SECONDS, IDLE_BACKOFF_FACTOR))
+
+# Ciclos de polling simultáneos (sesiones Odoo + escrituras) entre todas las
+# conexiones; el resto espera turno sin perder su deadline
+MAX_CONCURRENT_CYCLES = 16
+
+
 class _ConnectionTask:
     def __init__(self) -> None:
         self.task: asyncio.Task | None = None
-        self.http_client: httpx.AsyncClient | None = None
         self.circuit_breaker = CircuitBreaker()
+        self.wake = asyncio.Event()
+        self.idle_cycles = 0
+
+    def interval(self, poll_interval: int) -> float:
+        return min(
+            poll_interval * IDLE_BACKOFF_FACTOR ** min(self.idle_cycles, MAX_IDLE_CYCLES),
+            max(poll_interval, MAX_POLL_INTERVAL_SECONDS),
+        )
 
 
 class Scheduler:
@@ -41,6 +74,9 @@ class Scheduler:
         sent_repo: SentOrderRepository,
         on_sync_complete: OnSyncComplete | None = None,
         on_circuit_state_change: OnCircuitStateChange | None = None,
+        stop_event: asyncio.Event | None = None,
+        http_client: httpx.AsyncClient | None = None,
+        max_concurrent_cycles: int = MAX_CONCURRENT_CYCLES,
     ) -> None:
         self._conn_repo = conn_repo
         self._sync_log_repo = sync_log_repo
@@ -50,6 +86,14 @@ class Scheduler:
         self._on_circuit_state_change = on_circuit_state_change
         self._tasks: dict[int, _ConnectionTask] = {}
         self._running = False
+        self._stop_event = stop_event or asyncio.Event()
+        self._http = http_client
+        self._owns_http = http_client is None
+        self._cycle_sem = asyncio.Semaphore(max_concurrent_cycles)
+        self._janitor_task: asyncio.Task | None = None
+        # Breakers por host de webhook, compartidos por los senders de todas
+        # las conexiones
+        self._host_breakers: dict[str, CircuitBreaker] = {}
 
     @property
     def running(self) -> bool:
@@ -61,16 +105,31 @@ class Scheduler:
 
     async def start(self) -> None:
         self._running = True
-        connections = await self._conn_repo.list_enabled()
+        if self._http is None:
+            self._http = new_http_client(SHARED_LIMITS)
+        # El poll loop relee cada conexión con `get()`, que sí desencripta
+        connections = await self._conn_repo.list_enabled(with_secrets=False)
         for conn in connections:
             await self.add_connection(conn)
+        self._janitor_task = asyncio.create_task(self._janitor(), name="janitor")
         logger.info("Scheduler iniciado con %d conexiones", len(connections))
 
     async def stop(self) -> None:
         self._running = False
+        self._stop_event.set()
+        for ct in self._tasks.values():
+            ct.wake.set()
+        if self._janitor_task:
+            # Esperar su rollback antes de que se cierre la DB
+            self._janitor_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._janitor_task
+            self._janitor_task = None
         conn_ids = list(self._tasks.keys())
-        for conn_id in conn_ids:
-            await self.remove_connection(conn_id)
+        await asyncio.gather(*(self.remove_connection(cid) for cid in conn_ids))
+        if self._owns_http and self._http:
+            await self._http.aclose()
+            self._http = None
         logger.info("Scheduler detenido")
 
     async def add_connection(self, conn: Connection) -> None:
@@ -78,7 +137,6 @@ class Scheduler:
             return
 
         ct = _ConnectionTask()
-        ct.http_client = httpx.AsyncClient(timeout=30.0)
         ct.circuit_breaker.load_state(conn.circuit_state, conn.circuit_failure_count)
         ct.task = asyncio.create_task(
             self._poll_loop(conn, ct), name=f"poll-{conn.id}-{conn.name}"
@@ -92,11 +150,10 @@ class Scheduler:
         if ct.task and not ct.task.done():
             ct.task.cancel()
             try:
-                await asyncio.wait_for(asyncio.shield(ct.task), timeout=5.0)
-            except (asyncio.CancelledError, asyncio.TimeoutError):
+                async with asyncio.timeout(5.0):
+                    await ct.task
+            except (asyncio.CancelledError, TimeoutError):
                 pass
-        if ct.http_client:
-            await ct.http_client.aclose()
 
     async def restart_connection(self, conn: Connection) -> None:
         await self.remove_connection(conn.id)
@@ -112,9 +169,54 @@ class Scheduler:
             )
             if self._on_circuit_state_change:
                 await self._on_circuit_state_change(conn_id, CircuitState.CLOSED)
+            self.wake(conn_id)
+
+    async def _janitor(self) -> None:
+        """Recorta sent_orders/sync_logs y limpia la retry queue de todas las
+        conexiones activas cada JANITOR_INTERVAL_SECONDS.
+
+        Una transacción por conexión, con el mismo lock de escritura que los
+        ciclos: no retiene el lock durante toda la pasada.
+        """
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._stop_event.wait(), timeout=JANITOR_INTERVAL_SECONDS
+                )
+                return
+            except TimeoutError:
+                pass
+            try:
+                for conn_id in list(self._tasks):
+                    async with self._retry_repo.transaction():
+                        await self._sent_repo.trim_to_limit(conn_id, MAX_SENT_ORDERS)
+                        await self._sync_log_repo.trim_to_limit(conn_id, MAX_SYNC_LOGS)
+                        await self._retry_repo.cleanup_finished(conn_id)
+            except Exception as e:
+                logger.error("Error en janitor: %s", e, exc_info=True)
+
+    def wake(self, conn_id: int) -> None:
+        """Adelanta el próximo ciclo de la conexión y descarta su backoff ocioso."""
+        ct = self._tasks.get(conn_id)
+        if ct:
+            ct.idle_cycles = 0
+            ct.wake.set()
+
+    async def _wait(self, ct: _ConnectionTask, timeout: float) -> bool:
+        """Espera `timeout` segundos o un `wake()`. True si el scheduler se detuvo."""
+        try:
+            await asyncio.wait_for(ct.wake.wait(), timeout=timeout)
+        except TimeoutError:
+            pass
+        ct.wake.clear()
+        return self._stop_event.is_set()
 
     async def _poll_loop(self, conn: Connection, ct: _ConnectionTask) -> None:
-        odoo_client: OdooClient | None = None
+        worker: PollWorker | None = None
+        sender = WebhookSender(self._http, self._host_breakers)
+        loop = asyncio.get_running_loop()
+        # Deadline absoluto: la duración del ciclo no corre el siguiente
+        next_deadline = loop.time()
         try:
             while self._running:
                 try:
@@ -125,28 +227,38 @@ class Scheduler:
                         break
                     conn = fresh
 
-                    if odoo_client is None:
+                    if worker is None:
                         odoo_client = OdooClient(
                             conn.odoo_url,
                             conn.odoo_db,
                             conn.odoo_username,
                             conn.odoo_api_key,
-                            http_client=ct.http_client,
+                            http_client=self._http,
                         )
+                        worker = PollWorker(
+                            connection=conn,
+                            odoo_client=odoo_client,
+                            sender=sender,
+                            circuit_breaker=ct.circuit_breaker,
+                            conn_repo=self._conn_repo,
+                            sync_log_repo=self._sync_log_repo,
+                            retry_repo=self._retry_repo,
+                            sent_repo=self._sent_repo,
+                        )
+                    else:
+                        worker.connection = conn
 
                     prev_state = ct.circuit_breaker.state
-                    sender = WebhookSender(ct.http_client)
-                    worker = PollWorker(
-                        connection=conn,
-                        odoo_client=odoo_client,
-                        sender=sender,
-                        circuit_breaker=ct.circuit_breaker,
-                        conn_repo=self._conn_repo,
-                        sync_log_repo=self._sync_log_repo,
-                        retry_repo=self._retry_repo,
-                        sent_repo=self._sent_repo,
-                    )
-                    sync_log = await worker.execute()
+                    async with self._cycle_sem:
+                        sync_log = await worker.execute()
+                    if (
+                        sync_log
+                        and not sync_log.error_message
+                        and not sync_log.orders_found
+                    ):
+                        ct.idle_cycles = min(ct.idle_cycles + 1, MAX_IDLE_CYCLES)
+                    else:
+                        ct.idle_cycles = 0
 
                     if self._on_sync_complete:
                         await self._on_sync_complete(conn.id, sync_log)
@@ -165,10 +277,16 @@ class Scheduler:
                         exc_info=True,
                     )
 
-                await asyncio.sleep(conn.poll_interval_seconds)
+                next_deadline += ct.interval(conn.poll_interval_seconds)
+                now = loop.time()
+                if next_deadline < now:
+                    # Ciclo más largo que el intervalo: se reprograma desde
+                    # ahora en vez de encadenar ciclos atrasados
+                    next_deadline = now
+                if await self._wait(ct, next_deadline - now):
+                    break
+                # Si un wake() cortó la espera, el intervalo cuenta desde ahora
+                next_deadline = min(next_deadline, loop.time())
 
         except asyncio.CancelledError:
             logger.info("Poll loop cancelado para '%s'", conn.name)
-        finally:
-            if odoo_client and odoo_client._owns_http is False:
-                pass  # No cerrar, el scheduler cierra el http_client
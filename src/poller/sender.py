@@ -1,13 +1,29 @@
 from __future__ import annotations
 
 import logging
-from dataclasses import dataclass
+import random
+from urllib.parse import urlsplit
 
 import httpx
+import orjson
+
+from src.poller.circuit_breaker import CircuitBreaker, CircuitBreakerConfig
 
 logger = logging.getLogger(__name__)
 
-BACKOFF_SCHEDULE = [30, 60, 120, 240, 600]
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 600
+# Base por intento (30, 60, 120, 240, 480, 600); desde el 5 queda en el tope
+_BACKOFF_BASES = tuple(
+    min(BACKOFF_BASE_SECONDS << attempt, BACKOFF_MAX_SECONDS) for attempt in range(6)
+)
+
+# Breaker por host de webhook; el Scheduler comparte un mapa entre todas las
+# conexiones. Solo cuentan errores de red, 5xx y 429 (un 4xx indica que el
+# host responde)
+HOST_BREAKER_CONFIG = CircuitBreakerConfig(
+    failure_threshold=5, recovery_timeout=30.0, success_threshold=1
+)
 
 
 class WebhookSendError(Exception):
@@ -17,13 +33,26 @@ class WebhookSendError(Exception):
 
 
 class WebhookSender:
-    def __init__(self, http_client: httpx.AsyncClient) -> None:
+    def __init__(
+        self,
+        http_client: httpx.AsyncClient,
+        host_breakers: dict[str, CircuitBreaker] | None = None,
+    ) -> None:
         self._http = http_client
+        # Sin mapa compartido (p.ej. la CLI), los breakers son propios del sender
+        self._host_breakers = {} if host_breakers is None else host_breakers
+
+    def _breaker_for(self, url: str) -> CircuitBreaker:
+        host = urlsplit(url).netloc
+        cb = self._host_breakers.get(host)
+        if cb is None:
+            cb = self._host_breakers[host] = CircuitBreaker(HOST_BREAKER_CONFIG)
+        return cb
 
     async def send(
         self,
         url: str,
-        payload: dict,
+        payload: dict | bytes | str,
         webhook_secret: str = "",
         connection_external_id: str = "",
     ) -> None:
@@ -34,23 +63,41 @@ class WebhookSender:
         if webhook_secret:
             headers["X-Webhook-Secret"] = webhook_secret
 
+        cb = self._breaker_for(url)
+        if not cb.check_allowed():
+            raise WebhookSendError(f"Circuit breaker abierto para {urlsplit(url).netloc}")
+
         try:
-            response = await self._http.post(url, json=payload, headers=headers)
+            response = await self._http.post(
+                url,
+                # Cuerpos ya serializados (retry queue) se envían tal cual
+                content=orjson.dumps(payload) if isinstance(payload, dict) else payload,
+                headers=headers,
+            )
             response.raise_for_status()
+            cb.record_success()
             logger.info(
                 "Webhook enviado OK: connection=%s, status=%d",
                 connection_external_id,
                 response.status_code,
             )
         except httpx.HTTPStatusError as e:
+            status = e.response.status_code
+            if status >= 500 or status == 429:
+                cb.record_failure()
+            else:
+                cb.record_success()
             raise WebhookSendError(
                 f"HTTP {e.response.status_code}: {e.response.text[:200]}",
                 status_code=e.response.status_code,
             ) from e
         except httpx.RequestError as e:
+            cb.record_failure()
             raise WebhookSendError(str(e)) from e
 
     @staticmethod
     def calculate_next_retry(attempt: int) -> int:
-        idx = min(attempt, len(BACKOFF_SCHEDULE) - 1)
-        return BACKOFF_SCHEDULE[idx]
+        # Exponencial con jitter ±50%: conexiones que fallan a la vez contra el
+        # mismo host no reintentan todas en el mismo instante
+        base = _BACKOFF_BASES[min(attempt, len(_BACKOFF_BASES) - 1)]
+        return int(random.uniform(base * 0.5, base * 1.5))
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
-import json
+import asyncio
 import logging
-from datetime import datetime, timezone, timedelta
+
+import orjson
 
 from src.db.models import (
     CircuitState,
@@ -17,9 +18,14 @@ from src.db.repositories import (
     RetryQueueRepository,
     SentOrderRepository,
     SyncLogRepository,
+    utc_now,
 )
 from src.odoo.client import OdooClient, OdooRateLimitError
-from src.odoo.mapper import fetch_batch_data, map_order_to_webhook_payload
+from src.odoo.mapper import (
+    BatchOdooData,
+    fetch_batch_data,
+    map_order_to_webhook_payload,
+)
 from src.poller.circuit_breaker import CircuitBreaker
 from src.poller.sender import WebhookSender, WebhookSendError
 
@@ -27,8 +33,15 @@ logger = logging.getLogger(__name__)
 
 MAX_SENT_ORDERS = 30
 MAX_SYNC_LOGS = 100
-
-ORDER_FIELDS = [
+# Los recortes de sent_orders/sync_logs/retry_queue los hace el janitor del
+# Scheduler cada JANITOR_INTERVAL_SECONDS, no cada ciclo
+JANITOR_INTERVAL_SECONDS = 300
+# Webhooks simultáneos por conexión dentro de un ciclo
+WEBHOOK_CONCURRENCY = 8
+
+# Constantes (tuplas): orjson las serializa como arrays y no se reconstruyen
+# en cada ciclo
+ORDER_FIELDS = (
     "name",
     "state",
     "date_order",
@@ -40,11 +53,8 @@ ORDER_FIELDS = [
     "amount_total",
     "currency_id",
     "note",
-]
-
-
-def _now_str() -> str:
-    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+)
+_CONFIRMED_DOMAIN = (("state", "in", ("sale", "done")),)
 
 
 class PollWorker:
@@ -68,14 +78,23 @@ class PollWorker:
         self._retry_repo = retry_repo
         self._sent_repo = sent_repo
 
+    @property
+    def connection(self) -> Connection:
+        return self._conn
+
+    @connection.setter
+    def connection(self, conn: Connection) -> None:
+        # El Scheduler reutiliza el worker y le pasa la fila releída en cada ciclo
+        self._conn = conn
+
     async def execute(self) -> SyncLog | None:
-        started_at = _now_str()
+        started_at = utc_now()
         orders_found = 0
         orders_sent = 0
         orders_failed = 0
         orders_skipped = 0
         error_message: str | None = None
-        rate_limited = False
+        synced_to: str | None = None
 
         try:
             if not self._cb.check_allowed():
@@ -94,10 +113,7 @@ class PollWorker:
                 return await self._execute_seed(started_at)
 
             # Buscar órdenes confirmadas
-            domain: list = [
-                ["state", "in", ["sale", "done"]],
-                ["write_date", ">", self._conn.last_sync_at],
-            ]
+            domain = [*_CONFIRMED_DOMAIN, ("write_date", ">", self._conn.last_sync_at)]
 
             orders = await self._odoo.search_read(
                 "sale.order", domain, ORDER_FIELDS, order="write_date asc"
@@ -106,187 +122,219 @@ class PollWorker:
 
             if not orders:
                 self._cb.record_success()
-                await self._conn_repo.update_circuit_state(
-                    self._conn.id, self._cb.state, self._cb.failure_count
-                )
-                await self._sync_repo.trim_to_limit(self._conn.id, MAX_SYNC_LOGS)
-                await self._retry_repo.cleanup_finished(self._conn.id)
-                sync_log = await self._log(
-                    started_at, orders_found, orders_sent, orders_failed, orders_skipped, None
-                )
-                return sync_log
+                async with self._conn_repo.transaction():
+                    await self._save_cycle_result()
+                    return await self._log(
+                        started_at, orders_found, orders_sent, orders_failed, orders_skipped, None
+                    )
 
             # Filtrar ya enviadas (idempotencia)
-            sent_set = await self._sent_repo.get_sent_ids(self._conn.id)
-            new_orders = [
-                o for o in orders
-                if (o["id"], o.get("write_date", "")) not in sent_set
-            ]
+            keys = [(o["id"], o.get("write_date", "")) for o in orders]
+            sent_set = await self._sent_repo.filter_sent(self._conn.id, keys)
+            new_orders = [o for o, key in zip(orders, keys) if key not in sent_set]
             orders_skipped = orders_found - len(new_orders)
 
             if new_orders:
                 batch = await fetch_batch_data(self._odoo, new_orders)
 
-                last_write_date = self._conn.last_sync_at
-                for order in new_orders:
-                    payload = map_order_to_webhook_payload(
-                        order, batch, self._conn.odoo_db, self._conn.external_id
+                sent: list[SentOrder] = []
+                retries: list[RetryItem] = []
+                sem = asyncio.Semaphore(WEBHOOK_CONCURRENCY)
+                try:
+                    # return_exceptions: un error inesperado no deja envíos
+                    # corriendo después del flush del finally
+                    results = await asyncio.gather(
+                        *(
+                            self._send_order(order, batch, sem, sent, retries)
+                            for order in new_orders
+                        ),
+                        return_exceptions=True,
                     )
-                    try:
-                        await self._sender.send(
-                            self._conn.webhook_url,
-                            payload,
-                            self._conn.webhook_secret,
-                            self._conn.external_id,
-                        )
-                        await self._sent_repo.mark_sent(
-                            SentOrder(
-                                connection_id=self._conn.id,
-                                odoo_order_id=order["id"],
-                                odoo_order_name=order.get("name", ""),
-                                odoo_write_date=order.get("write_date", ""),
-                                sent_at=_now_str(),
-                            )
-                        )
-                        orders_sent += 1
-                    except WebhookSendError as e:
-                        orders_failed += 1
-                        logger.warning(
-                            "Webhook falló para orden %s: %s",
-                            order.get("name"),
-                            e,
-                        )
-                        next_retry_seconds = WebhookSender.calculate_next_retry(0)
-                        next_retry = (
-                            datetime.now(timezone.utc) + timedelta(seconds=next_retry_seconds)
-                        ).strftime("%Y-%m-%d %H:%M:%S")
-                        await self._retry_repo.enqueue(
-                            RetryItem(
-                                connection_id=self._conn.id,
-                                odoo_order_id=order["id"],
-                                odoo_order_name=order.get("name", ""),
-                                payload=json.dumps(payload),
-                                next_retry_at=next_retry,
-                            )
-                        )
-
-                    wd = order.get("write_date", "")
-                    if wd and (not last_write_date or wd > last_write_date):
-                        last_write_date = wd
-
-                if last_write_date:
-                    await self._conn_repo.update_last_sync(self._conn.id, last_write_date)
-                    self._conn.last_sync_at = last_write_date
-
-                # Mantener máximo MAX_SENT_ORDERS por conexión
-                await self._sent_repo.trim_to_limit(self._conn.id, MAX_SENT_ORDERS)
+                finally:
+                    # Registrar lo ya enviado aunque el ciclo se interrumpa;
+                    # enviadas y reintentos en una sola transacción
+                    async with self._retry_repo.transaction():
+                        await self._sent_repo.bulk_mark_sent(sent)
+                        await self._retry_repo.enqueue_many(retries)
+                orders_sent = len(sent)
+                orders_failed = len(retries)
+                for result in results:
+                    if isinstance(result, BaseException):
+                        raise result
+
+            # search_read ordena por write_date asc: la última orden trae el
+            # máximo. Incluye las ya enviadas, para no volver a pedirlas
+            last_write_date = orders[-1].get("write_date") or ""
+            if last_write_date > self._conn.last_sync_at:
+                synced_to = last_write_date
+                self._conn.last_sync_at = last_write_date
 
             # Procesar retry queue
             await self._process_retries()
 
             self._cb.record_success()
 
-            await self._sync_repo.trim_to_limit(self._conn.id, MAX_SYNC_LOGS)
-            await self._retry_repo.cleanup_finished(self._conn.id)
-
         except OdooRateLimitError as e:
             logger.warning("Rate limit en '%s': %s", self._conn.name, e)
             error_message = str(e)
-            rate_limited = True
         except Exception as e:
             logger.error("Error en polling '%s': %s", self._conn.name, e, exc_info=True)
             error_message = str(e)
             self._cb.record_failure()
 
-        await self._conn_repo.update_circuit_state(
-            self._conn.id, self._cb.state, self._cb.failure_count
-        )
+        # Estado del breaker, last_sync_at y sync log en una transacción
+        async with self._conn_repo.transaction():
+            await self._save_cycle_result(synced_to)
+            return await self._log(
+                started_at, orders_found, orders_sent, orders_failed, orders_skipped, error_message
+            )
 
-        return await self._log(
-            started_at, orders_found, orders_sent, orders_failed, orders_skipped, error_message
+    async def _send_order(
+        self,
+        order: dict,
+        batch: BatchOdooData,
+        sem: asyncio.Semaphore,
+        sent: list[SentOrder],
+        retries: list[RetryItem],
+    ) -> None:
+        # Se serializa una vez: el mismo cuerpo va al webhook y, si falla,
+        # a la retry queue
+        body = orjson.dumps(
+            map_order_to_webhook_payload(
+                order, batch, self._conn.odoo_db, self._conn.external_id
+            )
+        )
+        async with sem:
+            try:
+                await self._sender.send(
+                    self._conn.webhook_url,
+                    body,
+                    self._conn.webhook_secret,
+                    self._conn.external_id,
+                )
+            except WebhookSendError as e:
+                logger.warning("Webhook falló para orden %s: %s", order.get("name"), e)
+                next_retry = utc_now(WebhookSender.calculate_next_retry(0))
+                retries.append(
+                    RetryItem(
+                        connection_id=self._conn.id,
+                        odoo_order_id=order["id"],
+                        odoo_order_name=order.get("name", ""),
+                        odoo_write_date=order.get("write_date", ""),
+                        payload=body,
+                        next_retry_at=next_retry,
+                    )
+                )
+                return
+        sent.append(
+            SentOrder(
+                connection_id=self._conn.id,
+                odoo_order_id=order["id"],
+                odoo_order_name=order.get("name", ""),
+                odoo_write_date=order.get("write_date", ""),
+            )
         )
 
     async def _execute_seed(self, started_at: str) -> SyncLog:
         """Primera sincronización: registra las últimas N órdenes sin enviar webhooks."""
         logger.info("Seed inicial para '%s': registrando últimas %d órdenes", self._conn.name, MAX_SENT_ORDERS)
 
-        domain: list = [["state", "in", ["sale", "done"]]]
         orders = await self._odoo.search_read(
-            "sale.order", domain, ORDER_FIELDS,
+            "sale.order", _CONFIRMED_DOMAIN, ORDER_FIELDS,
             limit=MAX_SENT_ORDERS, order="write_date desc",
         )
         orders_found = len(orders)
 
         last_write_date: str | None = None
+        seeded: list[SentOrder] = []
         for order in orders:
-            await self._sent_repo.mark_sent(
+            seeded.append(
                 SentOrder(
                     connection_id=self._conn.id,
                     odoo_order_id=order["id"],
                     odoo_order_name=order.get("name", ""),
                     odoo_write_date=order.get("write_date", ""),
-                    sent_at=_now_str(),
                 )
             )
             wd = order.get("write_date", "")
             if wd and (not last_write_date or wd > last_write_date):
                 last_write_date = wd
+        self._cb.record_success()
+        # Órdenes registradas y last_sync_at se confirman juntos: un seed
+        # interrumpido no deja la conexión a medio sembrar
+        async with self._conn_repo.transaction():
+            await self._sent_repo.bulk_mark_sent(seeded)
+            await self._save_cycle_result(last_write_date)
+            sync_log = await self._log(started_at, orders_found, 0, 0, orders_found, None)
 
         if last_write_date:
-            await self._conn_repo.update_last_sync(self._conn.id, last_write_date)
             self._conn.last_sync_at = last_write_date
-
-        self._cb.record_success()
-        await self._conn_repo.update_circuit_state(
-            self._conn.id, self._cb.state, self._cb.failure_count
-        )
-
         logger.info(
             "Seed completado para '%s': %d órdenes registradas (0 webhooks enviados)",
             self._conn.name, orders_found,
         )
-        return await self._log(started_at, orders_found, 0, 0, orders_found, None)
+        return sync_log
 
     async def _process_retries(self) -> None:
         pending = await self._retry_repo.get_pending(self._conn.id)
-        for item in pending:
-            if item.attempts >= item.max_attempts:
-                await self._retry_repo.update_status(
-                    item.id, RetryStatus.DISCARDED, last_error="Max attempts reached"
-                )
-                continue
-
-            try:
-                payload = json.loads(item.payload)
-                await self._sender.send(
-                    self._conn.webhook_url,
-                    payload,
-                    self._conn.webhook_secret,
-                    self._conn.external_id,
-                )
-                await self._retry_repo.update_status(item.id, RetryStatus.SENT)
-                await self._sent_repo.mark_sent(
-                    SentOrder(
-                        connection_id=self._conn.id,
-                        odoo_order_id=item.odoo_order_id,
-                        odoo_order_name=item.odoo_order_name,
-                        odoo_write_date=payload.get("order", {}).get("write_date", ""),
-                        sent_at=_now_str(),
+        sent: list[SentOrder] = []
+        processed: list[RetryItem] = []
+        try:
+            for item in pending:
+                processed.append(item)
+                if item.attempts >= item.max_attempts:
+                    item.status = RetryStatus.DISCARDED
+                    item.last_error = "Max attempts reached"
+                    continue
+
+                try:
+                    await self._sender.send(
+                        self._conn.webhook_url,
+                        item.payload,
+                        self._conn.webhook_secret,
+                        self._conn.external_id,
                     )
-                )
-            except WebhookSendError as e:
-                new_attempt = item.attempts + 1
-                next_seconds = WebhookSender.calculate_next_retry(new_attempt)
-                next_at = (
-                    datetime.now(timezone.utc) + timedelta(seconds=next_seconds)
-                ).strftime("%Y-%m-%d %H:%M:%S")
-                await self._retry_repo.update_status(
-                    item.id,
-                    RetryStatus.PENDING,
-                    attempts=new_attempt,
-                    next_retry_at=next_at,
-                    last_error=str(e),
-                )
+                    item.status = RetryStatus.SENT
+                    # Items encolados antes de guardar odoo_write_date: leerlo del payload
+                    write_date = item.odoo_write_date or (
+                        orjson.loads(item.payload).get("order", {}).get("write_date", "")
+                    )
+                    sent.append(
+                        SentOrder(
+                            connection_id=self._conn.id,
+                            odoo_order_id=item.odoo_order_id,
+                            odoo_order_name=item.odoo_order_name,
+                            odoo_write_date=write_date,
+                        )
+                    )
+                except WebhookSendError as e:
+                    item.attempts += 1
+                    item.next_retry_at = utc_now(
+                        WebhookSender.calculate_next_retry(item.attempts)
+                    )
+                    item.last_error = str(e)
+        finally:
+            # Estados de la retry queue y órdenes enviadas en una transacción
+            async with self._retry_repo.transaction():
+                await self._retry_repo.update_many(processed)
+                await self._sent_repo.bulk_mark_sent(sent)
+
+    async def _save_cycle_result(self, last_sync_at: str | None = None) -> None:
+        state = self._cb.state
+        failure_count = self._cb.failure_count
+        # self._conn se relee en cada ciclo: si el breaker no cambió y no hay
+        # last_sync_at nuevo, la fila ya está al día
+        if (
+            last_sync_at is None
+            and state is self._conn.circuit_state
+            and failure_count == self._conn.circuit_failure_count
+        ):
+            return
+        await self._conn_repo.update_cycle_result(
+            self._conn.id, state, failure_count, last_sync_at=last_sync_at
+        )
+        self._conn.circuit_state = state
+        self._conn.circuit_failure_count = failure_count
 
     async def _log(
         self,
@@ -301,7 +349,7 @@ class PollWorker:
             SyncLog(
                 connection_id=self._conn.id,
                 started_at=started_at,
-                finished_at=_now_str(),
+                finished_at=utc_now(),
                 orders_found=found,
                 orders_sent=sent,
                 orders_failed=failed,
@@ -0,0 +1,64 @@
+from collections import deque
+
+import httpx
+import pytest
+import pytest_asyncio
+from cryptography.fernet import Fernet
+
+from src.encryption import FieldEncryptor
+
+
+class ScriptedTransport(httpx.MockTransport):
+    """MockTransport que responde en orden las respuestas encoladas con `expect`.
+
+    Guarda las requests recibidas en `requests`. Se comparte entre tests
+    (fixture `transport` lo limpia) junto con el AsyncClient de sesión.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(self._handle)
+        self._responses: deque[httpx.Response] = deque()
+        self.requests: list[httpx.Request] = []
+
+    def expect(self, *responses: httpx.Response) -> None:
+        self._responses.extend(responses)
+
+    def reset(self) -> None:
+        self._responses.clear()
+        self.requests.clear()
+
+    def _handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if not self._responses:
+            raise AssertionError(f"Request no esperada: {request.method} {request.url}")
+        # Copia: la misma respuesta encolada puede servir a varias requests
+        r = self._responses.popleft()
+        return httpx.Response(r.status_code, headers=r.headers, content=r.content)
+
+
+@pytest.fixture(scope="session")
+def encryption_key():
+    return Fernet.generate_key().decode()
+
+
+@pytest.fixture(scope="session")
+def shared_encryptor(encryption_key):
+    return FieldEncryptor(encryption_key)
+
+
+@pytest.fixture(scope="session")
+def _scripted_transport():
+    return ScriptedTransport()
+
+
+@pytest_asyncio.fixture(scope="session")
+async def mock_http(_scripted_transport):
+    async with httpx.AsyncClient(transport=_scripted_transport) as http:
+        yield http
+
+
+@pytest.fixture
+def transport(_scripted_transport):
+    _scripted_transport.reset()
+    yield _scripted_transport
+    _scripted_transport.reset()
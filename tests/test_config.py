@@ -0,0 +1,41 @@
+import pytest
+
+from src import config
+from src.config import Settings
+from src.db.database import DEFAULT_DB_READERS
+
+
+@pytest.fixture
+def env(monkeypatch):
+    values = {"POLLER_ENCRYPTION_KEY": "key"}
+    monkeypatch.setattr(config, "get_config", values.get)
+    monkeypatch.setattr(config, "require_config", values.get)
+    # Settings cachea por proceso: se restaura al terminar el test
+    monkeypatch.setattr(config, "_cached", None)
+    return values
+
+
+def test_defaults(env):
+    settings = Settings.reload()
+    assert settings.db_readers == DEFAULT_DB_READERS
+    assert settings.max_concurrent_polls == 16
+
+
+def test_zero_db_readers_allowed(env):
+    env["POLLER_DB_READERS"] = "0"
+    assert Settings.reload().db_readers == 0
+
+
+@pytest.mark.parametrize(
+    "name,value",
+    [
+        ("POLLER_MAX_CONCURRENT_POLLS", "0"),
+        ("POLLER_MAX_CONCURRENT_POLLS", "-1"),
+        ("POLLER_DB_READERS", "-1"),
+        ("POLLER_DB_READERS", "cuatro"),
+    ],
+)
+def test_rejects_invalid_ints(env, name, value):
+    env[name] = value
+    with pytest.raises(RuntimeError, match=name):
+        Settings.reload()
@@ -1,31 +1,47 @@
+import asyncio
 import os
 import tempfile
 
+import aiosqlite
 import pytest
-from cryptography.fernet import Fernet
+import pytest_asyncio
 
-from src.db.database import init_db
+from src.db.database import DbPool, init_db, init_pool
 from src.db.models import Connection, CircuitState
 from src.db.repositories import ConnectionRepository, RetryQueueRepository, SyncLogRepository, SentOrderRepository
-from src.encryption import FieldEncryptor
 
 
-@pytest.fixture
-async def db_and_repos():
-    key = Fernet.generate_key().decode()
-    enc = FieldEncryptor(key)
-    with tempfile.TemporaryDirectory() as tmpdir:
-        db_path = os.path.join(tmpdir, "test.db")
-        db = await init_db(db_path)
-        conn_repo = ConnectionRepository(db, enc)
-        sync_repo = SyncLogRepository(db)
-        sent_repo = SentOrderRepository(db)
-        retry_repo = RetryQueueRepository(db)
-        yield db, conn_repo, sync_repo, sent_repo, enc, retry_repo
-        await db.close()
+# Esquema creado una vez por sesión (el loop es de sesión, ver pyproject.toml)
+_TABLES = ("sent_orders", "retry_queue", "sync_logs", "connections")
+# Un solo executescript: un viaje al hilo de aiosqlite en vez de uno por sentencia
+_RESET_SCRIPT = "BEGIN;\n" + "".join(f"DELETE FROM {t};\n" for t in _TABLES) + (
+    "DELETE FROM sqlite_sequence;\nCOMMIT;"
+)
+
+
+@pytest_asyncio.fixture(scope="session")
+async def db_session():
+    db = await init_db(":memory:")
+    yield db
+    await db.close()
+
+
+@pytest_asyncio.fixture
+async def db_and_repos(db_session, shared_encryptor):
+    db = db_session
+    enc = shared_encryptor
+    conn_repo = ConnectionRepository(db, enc)
+    sync_repo = SyncLogRepository(db)
+    sent_repo = SentOrderRepository(db)
+    retry_repo = RetryQueueRepository(db)
+    yield db, conn_repo, sync_repo, sent_repo, enc, retry_repo
+    # Los repositories hacen commit, así que un SAVEPOINT no sobrevive al
+    # test: se vacían las tablas y se reinician los AUTOINCREMENT
+    if db.in_transaction:
+        await db.rollback()
+    await db.executescript(_RESET_SCRIPT)
 
 
-@pytest.mark.asyncio
 async def test_create_and_read_connection(db_and_repos):
     db, conn_repo, _, _, enc, _ = db_and_repos
 
@@ -57,19 +73,26 @@ async def test_create_and_read_connection(db_and_repos):
     assert enc.decrypt(row["odoo_api_key"]) == "secret-key-123"
 
 
-@pytest.mark.asyncio
 async def test_list_enabled_connections(db_and_repos):
     _, conn_repo, _, _, _, _ = db_and_repos
 
-    await conn_repo.create(Connection(name="A", odoo_url="u", odoo_db="d", odoo_username="u", odoo_api_key="k", webhook_url="w", enabled=True))
-    await conn_repo.create(Connection(name="B", odoo_url="u", odoo_db="d", odoo_username="u", odoo_api_key="k", webhook_url="w", enabled=False))
+    a, b = await conn_repo.create_many([
+        Connection(name="A", odoo_url="u", odoo_db="d", odoo_username="u", odoo_api_key="k", webhook_url="w", enabled=True),
+        Connection(name="B", odoo_url="u", odoo_db="d", odoo_username="u", odoo_api_key="k", webhook_url="w", enabled=False),
+    ])
+    assert b.id == a.id + 1
+    assert (await conn_repo.get(b.id)).name == "B"
 
     enabled = await conn_repo.list_enabled()
     assert len(enabled) == 1
     assert enabled[0].name == "A"
+    assert enabled[0].odoo_api_key == "k"
+
+    metadata = await conn_repo.list_all(with_secrets=False)
+    assert [c.name for c in metadata] == ["A", "B"]
+    assert all(c.odoo_api_key == "" and c.webhook_secret == "" for c in metadata)
 
 
-@pytest.mark.asyncio
 async def test_update_circuit_state(db_and_repos):
     _, conn_repo, _, _, _, _ = db_and_repos
 
@@ -81,7 +104,21 @@ async def test_update_circuit_state(db_and_repos):
     assert fetched.circuit_failure_count == 5
 
 
-@pytest.mark.asyncio
+async def test_update_cycle_result(db_and_repos):
+    _, conn_repo, _, _, _, _ = db_and_repos
+
+    conn = await conn_repo.create(Connection(name="Z", odoo_url="u", odoo_db="d", odoo_username="u", odoo_api_key="k", webhook_url="w"))
+    await conn_repo.update_cycle_result(conn.id, CircuitState.CLOSED, 0, last_sync_at="2024-01-01 00:00:00")
+    # Sin last_sync_at no se pisa el valor anterior
+    await conn_repo.update_cycle_result(conn.id, CircuitState.OPEN, 5)
+
+    fetched = await conn_repo.get(conn.id)
+    assert fetched.last_sync_at == "2024-01-01 00:00:00"
+    assert fetched.circuit_state == CircuitState.OPEN
+    assert fetched.circuit_failure_count == 5
+    assert fetched.circuit_last_failure_at
+
+
 async def test_sent_order_idempotency(db_and_repos):
     _, conn_repo, _, sent_repo, _, _ = db_and_repos
 
@@ -89,14 +126,16 @@ async def test_sent_order_idempotency(db_and_repos):
 
     from src.db.models import SentOrder
     order = SentOrder(connection_id=conn.id, odoo_order_id=42, odoo_order_name="SO042", odoo_write_date="2024-01-01 00:00:00")
-    await sent_repo.mark_sent(order)
+    assert await sent_repo.mark_sent(order)
+    assert not await sent_repo.mark_sent(
+        SentOrder(connection_id=conn.id, odoo_order_id=42, odoo_order_name="SO042", odoo_write_date="2024-01-01 00:00:00")
+    )
 
     assert await sent_repo.is_sent(conn.id, 42, "2024-01-01 00:00:00")
     assert not await sent_repo.is_sent(conn.id, 42, "2024-01-02 00:00:00")
     assert not await sent_repo.is_sent(conn.id, 99, "2024-01-01 00:00:00")
 
 
-@pytest.mark.asyncio
 async def test_sync_log_trim_to_limit(db_and_repos):
     _, conn_repo, sync_repo, _, _, _ = db_and_repos
 
@@ -120,7 +159,6 @@ async def test_sync_log_trim_to_limit(db_and_repos):
     assert [l.orders_found for l in logs] == [4, 3, 2]
 
 
-@pytest.mark.asyncio
 async def test_retry_queue_cleanup_finished(db_and_repos):
     _, conn_repo, _, _, _, retry_repo = db_and_repos
 
@@ -142,3 +180,210 @@ async def test_retry_queue_cleanup_finished(db_and_repos):
     assert len(remaining) == 1
     assert remaining[0].odoo_order_name == "SO1"
     assert remaining[0].status == RetryStatus.PENDING
+
+
+async def test_retry_queue_update_many(db_and_repos):
+    _, conn_repo, _, _, _, retry_repo = db_and_repos
+
+    from src.db.models import RetryItem, RetryStatus
+
+    conn = await conn_repo.create(Connection(name="R", odoo_url="u", odoo_db="d", odoo_username="u", odoo_api_key="k", webhook_url="w"))
+    a = await retry_repo.enqueue(RetryItem(connection_id=conn.id, odoo_order_id=1, odoo_order_name="SO1", payload="{}", next_retry_at="2000-01-01 00:00:00"))
+    b = await retry_repo.enqueue(RetryItem(connection_id=conn.id, odoo_order_id=2, odoo_order_name="SO2", payload="{}", next_retry_at="2000-01-01 00:00:00"))
+
+    a.status = RetryStatus.SENT
+    b.attempts, b.next_retry_at, b.last_error = 1, "2030-01-01 00:00:00", "HTTP 500"
+    await retry_repo.update_many([a, b])
+
+    by_name = {i.odoo_order_name: i for i in await retry_repo.list_by_connection(conn.id)}
+    assert by_name["SO1"].status == RetryStatus.SENT
+    assert by_name["SO2"].status == RetryStatus.PENDING
+    assert (by_name["SO2"].attempts, by_name["SO2"].next_retry_at, by_name["SO2"].last_error) == (1, "2030-01-01 00:00:00", "HTTP 500")
+    assert await retry_repo.get_pending(conn.id) == []
+
+
+async def test_sync_log_list_recent(db_and_repos):
+    _, conn_repo, sync_repo, _, _, _ = db_and_repos
+
+    from src.db.models import SyncLog
+
+    a = await conn_repo.create(Connection(name="A", odoo_url="u", odoo_db="d", odoo_username="u", odoo_api_key="k", webhook_url="w"))
+    b = await conn_repo.create(Connection(name="B", odoo_url="u", odoo_db="d", odoo_username="u", odoo_api_key="k", webhook_url="w"))
+
+    for i in range(3):
+        for conn in (a, b):
+            await sync_repo.create(SyncLog(
+                connection_id=conn.id,
+                started_at=f"2024-01-01 00:0{i}:00",
+                finished_at=f"2024-01-01 00:0{i}:01",
+                orders_found=i,
+            ))
+
+    recent = await sync_repo.list_recent(limit=4)
+    assert len(recent) == 4
+    assert [l.id for l in recent] == sorted((l.id for l in recent), reverse=True)
+    assert {l.connection_id for l in recent} == {a.id, b.id}
+
+
+async def test_bulk_mark_sent_ignores_duplicates(db_and_repos):
+    _, conn_repo, _, sent_repo, _, _ = db_and_repos
+
+    from src.db.models import SentOrder
+
+    conn = await conn_repo.create(Connection(name="B", odoo_url="u", odoo_db="d", odoo_username="u", odoo_api_key="k", webhook_url="w"))
+
+    orders = [
+        SentOrder(connection_id=conn.id, odoo_order_id=i, odoo_order_name=f"SO{i}", odoo_write_date="2024-01-01 00:00:00")
+        for i in range(3)
+    ]
+    await sent_repo.bulk_mark_sent(orders)
+    await sent_repo.bulk_mark_sent(orders[:1])
+
+    assert await sent_repo.get_sent_ids(conn.id) == {(i, "2024-01-01 00:00:00") for i in range(3)}
+
+
+async def test_pool_readers_see_committed_writes(shared_encryptor):
+    enc = shared_encryptor
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pool = await init_pool(os.path.join(tmpdir, "test.db"), readers=2)
+        try:
+            conn_repo = ConnectionRepository(pool, enc)
+            conn = await conn_repo.create(Connection(name="P", odoo_url="u", odoo_db="d", odoo_username="u", odoo_api_key="k", webhook_url="w"))
+
+            assert (await conn_repo.get(conn.id)).odoo_api_key == "k"
+            async with pool.reader() as reader:
+                assert reader is not pool.writer
+                with pytest.raises(aiosqlite.OperationalError):
+                    await reader.execute("DELETE FROM connections")
+        finally:
+            await pool.close()
+
+
+async def test_filter_sent_uses_cache_and_db(db_and_repos):
+    db, conn_repo, _, sent_repo, _, _ = db_and_repos
+
+    from src.db.models import SentOrder
+
+    conn = await conn_repo.create(Connection(name="F", odoo_url="u", odoo_db="d", odoo_username="u", odoo_api_key="k", webhook_url="w"))
+    await sent_repo.bulk_mark_sent(
+        [SentOrder(connection_id=conn.id, odoo_order_id=1, odoo_order_name="SO1", odoo_write_date="2024-01-01 00:00:00")]
+    )
+    await db.execute(
+        "INSERT INTO sent_orders (connection_id, odoo_order_id, odoo_write_date) VALUES (?, 2, '2024-01-01 00:00:00')",
+        (conn.id,),
+    )
+    await db.commit()
+
+    keys = [(1, "2024-01-01 00:00:00"), (2, "2024-01-01 00:00:00"), (2, "2024-01-02 00:00:00"), (3, "2024-01-01 00:00:00")]
+    assert await sent_repo.filter_sent(conn.id, keys) == {(1, "2024-01-01 00:00:00"), (2, "2024-01-01 00:00:00")}
+
+
+async def test_sent_order_trim_to_limit(db_and_repos):
+    _, conn_repo, _, sent_repo, _, _ = db_and_repos
+
+    from src.db.models import SentOrder
+
+    conn = await conn_repo.create(Connection(name="S", odoo_url="u", odoo_db="d", odoo_username="u", odoo_api_key="k", webhook_url="w"))
+
+    # Mismo sent_at para los 2 últimos: desempata por id
+    sent_at = ["2024-01-01 00:00:00", "2024-01-01 00:01:00", "2024-01-01 00:02:00", "2024-01-01 00:02:00"]
+    await sent_repo.bulk_mark_sent([
+        SentOrder(connection_id=conn.id, odoo_order_id=i, odoo_write_date="w", sent_at=ts)
+        for i, ts in enumerate(sent_at)
+    ])
+
+    await sent_repo.trim_to_limit(conn.id, limit=10)
+    assert len(await sent_repo.get_sent_ids(conn.id)) == 4
+
+    await sent_repo.trim_to_limit(conn.id, limit=2)
+    assert await sent_repo.get_sent_ids(conn.id) == {(2, "w"), (3, "w")}
+
+
+async def test_concurrent_writes_share_the_writer(db_and_repos):
+    _, conn_repo, sync_repo, sent_repo, _, _ = db_and_repos
+
+    from src.db.models import SentOrder, SyncLog
+
+    conn = await conn_repo.create(Connection(name="W", odoo_url="u", odoo_db="d", odoo_username="u", odoo_api_key="k", webhook_url="w"))
+
+    # Varias tasks escribiendo a la vez sobre la misma conexión escritora
+    await asyncio.gather(
+        *(
+            sync_repo.create(SyncLog(connection_id=conn.id, started_at="s", finished_at="f"))
+            for _ in range(5)
+        ),
+        *(
+            sent_repo.bulk_mark_sent([SentOrder(connection_id=conn.id, odoo_order_id=i, odoo_write_date="w")])
+            for i in range(5)
+        ),
+    )
+
+    assert len(await sync_repo.list_by_connection(conn.id)) == 5
+    assert len(await sent_repo.get_sent_ids(conn.id)) == 5
+
+
+async def test_failed_transaction_keeps_other_tasks_writes(db_and_repos):
+    db, conn_repo, sync_repo, _, _, _ = db_and_repos
+
+    from src.db.models import SyncLog
+
+    conn = await conn_repo.create(Connection(name="R", odoo_url="u", odoo_db="d", odoo_username="u", odoo_api_key="k", webhook_url="w"))
+    pool = DbPool.for_writer(db)
+    release = asyncio.Event()
+
+    async def failing():
+        async with pool.transaction() as tx:
+            await tx.execute("DELETE FROM connections")
+            await release.wait()
+            raise RuntimeError("boom")
+
+    task = asyncio.create_task(failing())
+    await asyncio.sleep(0)
+    # Espera el lock de la transacción en curso; su rollback no la afecta
+    log_task = asyncio.create_task(
+        sync_repo.create(SyncLog(connection_id=conn.id, started_at="s", finished_at="f"))
+    )
+    release.set()
+    with pytest.raises(RuntimeError):
+        await task
+    await log_task
+
+    assert await conn_repo.get(conn.id) is not None
+    assert len(await sync_repo.list_by_connection(conn.id)) == 1
+    assert not db.in_transaction
+
+
+async def test_repository_transaction_groups_writes(db_and_repos):
+    _, conn_repo, sync_repo, sent_repo, _, _ = db_and_repos
+
+    from src.db.models import SentOrder, SyncLog
+
+    conn = await conn_repo.create(Connection(name="T", odoo_url="u", odoo_db="d", odoo_username="u", odoo_api_key="k", webhook_url="w"))
+
+    with pytest.raises(RuntimeError):
+        async with conn_repo.transaction():
+            await sent_repo.bulk_mark_sent([SentOrder(connection_id=conn.id, odoo_order_id=1, odoo_write_date="w")])
+            await sync_repo.create(SyncLog(connection_id=conn.id, started_at="s", finished_at="f"))
+            raise RuntimeError("ciclo interrumpido")
+
+    assert await sync_repo.list_by_connection(conn.id) == []
+    assert await sent_repo.get_sent_ids(conn.id) == set()
+    # El cache de enviadas tampoco registra la orden descartada
+    assert await sent_repo.filter_sent(conn.id, [(1, "w")]) == set()
+
+
+async def test_migrate_drops_superseded_retry_index(db_and_repos):
+    db, *_ = db_and_repos
+
+    from src.db.database import _migrate
+
+    await db.execute(
+        "CREATE INDEX idx_retry_queue_next_retry ON retry_queue(next_retry_at) WHERE status = 'pending'"
+    )
+    await db.commit()
+    await _migrate(db)
+
+    cursor = await db.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'retry_queue'")
+    names = {r[0] for r in await cursor.fetchall()}
+    assert "idx_retry_queue_next_retry" not in names
+    assert "idx_retry_queue_due" in names
@@ -3,9 +3,8 @@ from cryptography.fernet import Fernet
 from src.encryption import FieldEncryptor
 
 
-def test_encrypt_decrypt_roundtrip():
-    key = Fernet.generate_key().decode()
-    enc = FieldEncryptor(key)
+def test_encrypt_decrypt_roundtrip(shared_encryptor):
+    enc = shared_encryptor
 
     plaintext = "mi-api-key-secreta-123"
     ciphertext = enc.encrypt(plaintext)
@@ -14,20 +13,52 @@ def test_encrypt_decrypt_roundtrip():
     assert enc.decrypt(ciphertext) == plaintext
 
 
-def test_different_encryptions_produce_different_ciphertexts():
-    key = Fernet.generate_key().decode()
-    enc = FieldEncryptor(key)
+def test_different_encryptions_produce_different_ciphertexts(shared_encryptor):
+    enc = shared_encryptor
 
     c1 = enc.encrypt("test")
     c2 = enc.encrypt("test")
-    # Fernet usa IV aleatorio, así que deben diferir
+    # Nonce aleatorio, así que deben diferir
     assert c1 != c2
     assert enc.decrypt(c1) == enc.decrypt(c2) == "test"
 
 
-def test_empty_string():
-    key = Fernet.generate_key().decode()
-    enc = FieldEncryptor(key)
+def test_empty_string(shared_encryptor):
+    enc = shared_encryptor
 
     ciphertext = enc.encrypt("")
     assert enc.decrypt(ciphertext) == ""
+
+
+def test_encrypt_decrypt_many(shared_encryptor):
+    enc = shared_encryptor
+
+    plaintexts = ["a", "", "mi-api-key"]
+    ciphertexts = enc.encrypt_many(plaintexts)
+
+    assert len(ciphertexts) == 3
+    assert enc.decrypt_many(ciphertexts) == plaintexts
+    assert [enc.decrypt(c) for c in ciphertexts] == plaintexts
+    # Cada token lleva su propio nonce aunque salgan del mismo os.urandom
+    assert len({c[1:13] for c in ciphertexts}) == 3
+
+
+def test_decrypts_legacy_fernet_tokens(shared_encryptor, encryption_key):
+    enc = shared_encryptor
+
+    legacy = Fernet(encryption_key.encode()).encrypt(b"clave-antigua")
+
+    assert enc.decrypt(legacy) == "clave-antigua"
+    assert enc.decrypt(legacy.decode()) == "clave-antigua"
+    assert not enc.encrypt("clave-antigua").startswith(b"gAAAA")
+
+
+def test_decrypt_cache_is_bounded():
+    key = Fernet.generate_key().decode()
+    enc = FieldEncryptor(key)
+    enc.DECRYPT_CACHE_SIZE = 2
+
+    tokens = [enc.encrypt(f"secret-{i}") for i in range(3)]
+    assert enc.decrypt_many(tokens) == ["secret-0", "secret-1", "secret-2"]
+    assert enc.decrypt(tokens[2]) == "secret-2"
+    assert list(enc._plain) == tokens[1:]
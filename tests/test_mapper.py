@@ -1,7 +1,11 @@
-from src.odoo.mapper import BatchOdooData, map_order_to_webhook_payload
+import pytest
 
+from src.odoo.mapper import BatchOdooData, fetch_batch_data, index_lines, map_order_to_webhook_payload
 
-def _make_batch():
+
+# El mapper solo lee el batch: se arma una vez por módulo
+@pytest.fixture(scope="module")
+def batch():
     batch = BatchOdooData(
         partners={
             1: {
@@ -26,9 +30,8 @@ def _make_batch():
             51: {"id": 51, "name": "Tmpl B", "default_code": ""},
         },
     )
-    # Simular _lines_by_order
-    batch._lines_by_order = {
-        10: [
+    batch.lines_by_order = index_lines(
+        [
             {
                 "order_id": [10, "SO001"],
                 "product_id": [100, "Producto A"],
@@ -63,11 +66,11 @@ def _make_batch():
                 "name": "Producto B x2",
             },
         ],
-    }
+    )
     return batch
 
 
-def test_map_order_basic():
+def test_map_order_basic(batch):
     order = {
         "id": 10,
         "name": "SO001",
@@ -82,7 +85,6 @@ def test_map_order_basic():
         "currency_id": [3, "CLP"],
         "note": "Nota de prueba",
     }
-    batch = _make_batch()
     payload = map_order_to_webhook_payload(order, batch, "testdb", 1)
 
     assert payload["source"] == "odoo"
@@ -100,7 +102,7 @@ def test_map_order_basic():
     assert payload["shipping_address"]["address"]["city"] == "Viña"
 
 
-def test_items_filter_zero_qty():
+def test_items_filter_zero_qty(batch):
     order = {
         "id": 10, "name": "SO001", "state": "sale",
         "date_order": "", "write_date": "",
@@ -108,7 +110,6 @@ def test_items_filter_zero_qty():
         "amount_untaxed": 0, "amount_tax": 0, "amount_total": 0,
         "currency_id": [3, "CLP"], "note": "",
     }
-    batch = _make_batch()
     payload = map_order_to_webhook_payload(order, batch, "testdb", 1)
 
     # Qty 0 debe ser filtrado: quedan 2 items de 3 lines
@@ -117,7 +118,7 @@ def test_items_filter_zero_qty():
     assert payload["items"][0]["quantity"] == 3
 
 
-def test_sku_fallback():
+def test_sku_fallback(batch):
     order = {
         "id": 10, "name": "SO001", "state": "sale",
         "date_order": "", "write_date": "",
@@ -125,14 +126,13 @@ def test_sku_fallback():
         "amount_untaxed": 0, "amount_tax": 0, "amount_total": 0,
         "currency_id": False, "note": "",
     }
-    batch = _make_batch()
     payload = map_order_to_webhook_payload(order, batch, "mydb", 1)
 
     # Segundo item (product 101) no tiene default_code ni barcode, template tampoco
     assert payload["items"][1]["sku"] == "ODOO-mydb-101"
 
 
-def test_shipping_falls_back_to_customer():
+def test_shipping_falls_back_to_customer(batch):
     order = {
         "id": 10, "name": "SO001", "state": "sale",
         "date_order": "", "write_date": "",
@@ -140,7 +140,40 @@ def test_shipping_falls_back_to_customer():
         "amount_untaxed": 0, "amount_tax": 0, "amount_total": 0,
         "currency_id": False, "note": "",
     }
-    batch = _make_batch()
     payload = map_order_to_webhook_payload(order, batch, "testdb", 1)
 
     assert payload["shipping_address"]["name"] == "Cliente Test"
+
+
+class _FakeOdoo:
+    def __init__(self):
+        self.reads = []
+
+    async def search_read(self, model, domain, fields, limit=0, order=""):
+        return [
+            {"id": 1, "order_id": [10, "SO001"], "product_id": [100, "A"], "product_template_id": [50, "A"]},
+            {"id": 2, "order_id": [10, "SO001"], "product_id": [101, "B"], "product_template_id": False},
+        ]
+
+    async def read(self, model, ids, fields):
+        self.reads.append((model, sorted(ids)))
+        data = {
+            "res.partner": {1: {"id": 1, "name": "C"}},
+            "product.product": {
+                100: {"id": 100, "product_tmpl_id": [50, "A"]},
+                101: {"id": 101, "product_tmpl_id": [51, "B"]},
+            },
+            "product.template": {50: {"id": 50}, 51: {"id": 51}},
+        }[model]
+        return [data[i] for i in ids if i in data]
+
+
+async def test_fetch_batch_data_reads_templates_from_lines():
+    client = _FakeOdoo()
+    batch = await fetch_batch_data(client, [{"id": 10, "partner_id": [1, "C"], "partner_shipping_id": False}])
+
+    assert set(batch.products) == {100, 101}
+    assert set(batch.variants) == {50, 51}
+    # 50 viene de la línea; 51 solo se conoce tras leer el producto
+    assert ("product.template", [50]) in client.reads
+    assert ("product.template", [51]) in client.reads
@@ -1,83 +1,73 @@
-import json
-
 import httpx
+import orjson
 import pytest
 
 from src.odoo.client import OdooClient, OdooAuthError, OdooRPCError, OdooRateLimitError
 
 
-def _make_jsonrpc_response(result):
-    return httpx.Response(200, json={"jsonrpc": "2.0", "result": result})
+_JSON_HEADERS = {"Content-Type": "application/json"}
 
 
-def _make_jsonrpc_error(message):
-    return httpx.Response(200, json={"jsonrpc": "2.0", "error": {"message": message, "data": {"message": message}}})
+def _make_jsonrpc_response(result):
+    return httpx.Response(
+        200, content=orjson.dumps({"jsonrpc": "2.0", "result": result}), headers=_JSON_HEADERS
+    )
 
 
-@pytest.mark.asyncio
-async def test_authenticate_success():
-    transport = httpx.MockTransport(
-        lambda req: _make_jsonrpc_response(42)
+def _make_jsonrpc_error(message):
+    return httpx.Response(
+        200,
+        content=orjson.dumps({"jsonrpc": "2.0", "error": {"message": message, "data": {"message": message}}}),
+        headers=_JSON_HEADERS,
     )
-    async with httpx.AsyncClient(transport=transport) as http:
-        client = OdooClient("https://test.odoo.com", "testdb", "admin", "key", http_client=http)
-        uid = await client.authenticate()
-        assert uid == 42
-        assert client.uid == 42
 
 
-@pytest.mark.asyncio
-async def test_authenticate_failure():
-    transport = httpx.MockTransport(
-        lambda req: _make_jsonrpc_response(False)
-    )
-    async with httpx.AsyncClient(transport=transport) as http:
-        client = OdooClient("https://test.odoo.com", "testdb", "admin", "bad-key", http_client=http)
-        with pytest.raises(OdooAuthError):
-            await client.authenticate()
-
-
-@pytest.mark.asyncio
-async def test_search_read():
-    call_count = 0
-
-    def handler(request):
-        nonlocal call_count
-        call_count += 1
-        if call_count == 1:
-            return _make_jsonrpc_response(1)  # authenticate
-        return _make_jsonrpc_response([
-            {"id": 10, "name": "SO001"},
-            {"id": 11, "name": "SO002"},
-        ])
+# ScriptedTransport copia la respuesta encolada: se serializan una sola vez
+_AUTH_OK = _make_jsonrpc_response(42)
+_AUTH_FAILED = _make_jsonrpc_response(False)
 
-    transport = httpx.MockTransport(handler)
-    async with httpx.AsyncClient(transport=transport) as http:
-        client = OdooClient("https://test.odoo.com", "testdb", "admin", "key", http_client=http)
-        result = await client.search_read("sale.order", [["state", "=", "sale"]], ["name"])
-        assert len(result) == 2
-        assert result[0]["name"] == "SO001"
 
+async def test_authenticate_success(mock_http, transport):
+    transport.expect(_AUTH_OK)
+    client = OdooClient("https://test.odoo.com", "testdb", "admin", "key", http_client=mock_http)
+    uid = await client.authenticate()
+    assert uid == 42
+    assert client.uid == 42
 
-@pytest.mark.asyncio
-async def test_rate_limit_detection():
-    transport = httpx.MockTransport(
-        lambda req: httpx.Response(429, text="Rate limited")
-    )
-    async with httpx.AsyncClient(transport=transport) as http:
-        client = OdooClient("https://test.odoo.com", "testdb", "admin", "key", http_client=http)
-        client._uid = 1  # Skip auth
-        with pytest.raises(OdooRateLimitError):
-            await client.search_read("sale.order", [], ["name"])
 
+async def test_authenticate_failure(mock_http, transport):
+    transport.expect(_AUTH_FAILED)
+    client = OdooClient("https://test.odoo.com", "testdb", "admin", "bad-key", http_client=mock_http)
+    with pytest.raises(OdooAuthError):
+        await client.authenticate()
 
-@pytest.mark.asyncio
-async def test_rpc_error():
-    transport = httpx.MockTransport(
-        lambda req: _make_jsonrpc_error("Field not found")
+
+async def test_search_read(mock_http, transport):
+    transport.expect(
+        _AUTH_OK,
+        _make_jsonrpc_response([
+            {"id": 10, "name": "SO001"},
+            {"id": 11, "name": "SO002"},
+        ]),
     )
-    async with httpx.AsyncClient(transport=transport) as http:
-        client = OdooClient("https://test.odoo.com", "testdb", "admin", "key", http_client=http)
-        client._uid = 1
-        with pytest.raises(OdooRPCError, match="Field not found"):
-            await client.search_read("sale.order", [], ["bad_field"])
+    client = OdooClient("https://test.odoo.com", "testdb", "admin", "key", http_client=mock_http)
+    result = await client.search_read("sale.order", [["state", "=", "sale"]], ["name"])
+    assert len(result) == 2
+    assert result[0]["name"] == "SO001"
+    assert len(transport.requests) == 2
+
+
+async def test_rate_limit_detection(mock_http, transport):
+    transport.expect(httpx.Response(429, text="Rate limited"))
+    client = OdooClient("https://test.odoo.com", "testdb", "admin", "key", http_client=mock_http)
+    client._uid = 1  # Skip auth
+    with pytest.raises(OdooRateLimitError):
+        await client.search_read("sale.order", [], ["name"])
+
+
+async def test_rpc_error(mock_http, transport):
+    transport.expect(_make_jsonrpc_error("Field not found"))
+    client = OdooClient("https://test.odoo.com", "testdb", "admin", "key", http_client=mock_http)
+    client._uid = 1
+    with pytest.raises(OdooRPCError, match="Field not found"):
+        await client.search_read("sale.order", [], ["bad_field"])
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from src.db.database import init_pool
+from src.db.repositories import ConnectionRepository, RetryQueueRepository, SentOrderRepository, SyncLogRepository
+from src.poller import scheduler as scheduler_module
+from src.poller.scheduler import MAX_IDLE_CYCLES, MAX_POLL_INTERVAL_SECONDS, Scheduler, _ConnectionTask
+
+
+def test_idle_interval_backs_off():
+    ct = _ConnectionTask()
+    assert ct.interval(10) == 10
+    ct.idle_cycles = 2
+    assert ct.interval(10) == 22.5
+
+
+@pytest.mark.parametrize("poll_interval", [1, 10, 60])
+def test_idle_interval_reaches_cap_at_max_idle_cycles(poll_interval):
+    ct = _ConnectionTask()
+    ct.idle_cycles = MAX_IDLE_CYCLES
+    assert ct.interval(poll_interval) == MAX_POLL_INTERVAL_SECONDS
+
+
+def test_idle_interval_does_not_overflow():
+    # Una conexión sin órdenes durante días no debe tumbar su poll loop
+    ct = _ConnectionTask()
+    ct.idle_cycles = 5000
+    assert ct.interval(60) == MAX_POLL_INTERVAL_SECONDS
+    assert ct.interval(600) == 600
+
+
+async def test_stop_waits_for_running_janitor(monkeypatch, shared_encryptor):
+    monkeypatch.setattr(scheduler_module, "JANITOR_INTERVAL_SECONDS", 0.01)
+    entered = asyncio.Event()
+
+    class _BlockingSentRepo(SentOrderRepository):
+        async def trim_to_limit(self, connection_id, limit=30):
+            async with self.transaction() as db:
+                await db.execute("DELETE FROM sent_orders WHERE connection_id = ?", (connection_id,))
+                entered.set()
+                await asyncio.Event().wait()
+
+    pool = await init_pool(":memory:")
+    try:
+        scheduler = Scheduler(
+            ConnectionRepository(pool, shared_encryptor),
+            SyncLogRepository(pool),
+            RetryQueueRepository(pool),
+            _BlockingSentRepo(pool),
+        )
+        scheduler._tasks[1] = _ConnectionTask()
+        janitor = scheduler._janitor_task = asyncio.create_task(scheduler._janitor())
+        await entered.wait()
+
+        await scheduler.stop()
+
+        # El janitor terminó y su transacción se descartó antes de cerrar la DB
+        assert janitor.done()
+        assert not pool.writer.in_transaction
+    finally:
+        await pool.close()
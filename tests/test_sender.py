@@ -4,61 +4,71 @@ import pytest
 from src.poller.sender import WebhookSender, WebhookSendError
 
 
-@pytest.mark.asyncio
-async def test_send_success():
-    captured = {}
-
-    def handler(request):
-        captured["headers"] = dict(request.headers)
-        captured["body"] = request.content
-        return httpx.Response(200, json={"ok": True})
-
-    transport = httpx.MockTransport(handler)
-    async with httpx.AsyncClient(transport=transport) as http:
-        sender = WebhookSender(http)
-        await sender.send(
-            "https://webhook.example.com/hook",
-            {"order": "test"},
-            webhook_secret="my-secret",
-            connection_external_id="abc-123",
-        )
-
-    assert captured["headers"]["x-webhook-secret"] == "my-secret"
-    assert captured["headers"]["x-odoo-connection-id"] == "abc-123"
-
-
-@pytest.mark.asyncio
-async def test_send_http_error():
-    transport = httpx.MockTransport(
-        lambda req: httpx.Response(500, text="Internal Server Error")
+async def test_send_success(mock_http, transport):
+    transport.expect(httpx.Response(200, json={"ok": True}))
+    sender = WebhookSender(mock_http)
+    await sender.send(
+        "https://webhook.example.com/hook",
+        {"order": "test"},
+        webhook_secret="my-secret",
+        connection_external_id="abc-123",
     )
-    async with httpx.AsyncClient(transport=transport) as http:
-        sender = WebhookSender(http)
-        with pytest.raises(WebhookSendError) as exc_info:
-            await sender.send("https://webhook.example.com/hook", {})
-        assert exc_info.value.status_code == 500
 
+    [request] = transport.requests
+    assert request.headers["x-webhook-secret"] == "my-secret"
+    assert request.headers["x-odoo-connection-id"] == "abc-123"
 
-@pytest.mark.asyncio
-async def test_send_without_secret():
-    captured = {}
 
-    def handler(request):
-        captured["headers"] = dict(request.headers)
-        return httpx.Response(200)
+async def test_send_http_error(mock_http, transport):
+    transport.expect(httpx.Response(500, text="Internal Server Error"))
+    sender = WebhookSender(mock_http)
+    with pytest.raises(WebhookSendError) as exc_info:
+        await sender.send("https://webhook.example.com/hook", {})
+    assert exc_info.value.status_code == 500
 
-    transport = httpx.MockTransport(handler)
-    async with httpx.AsyncClient(transport=transport) as http:
-        sender = WebhookSender(http)
-        await sender.send("https://webhook.example.com/hook", {"test": True})
 
-    assert "x-webhook-secret" not in captured["headers"]
+async def test_send_without_secret(mock_http, transport):
+    transport.expect(httpx.Response(200))
+    sender = WebhookSender(mock_http)
+    await sender.send("https://webhook.example.com/hook", {"test": True})
 
+    assert "x-webhook-secret" not in transport.requests[0].headers
 
-def test_backoff_schedule():
-    assert WebhookSender.calculate_next_retry(0) == 30
-    assert WebhookSender.calculate_next_retry(1) == 60
-    assert WebhookSender.calculate_next_retry(2) == 120
-    assert WebhookSender.calculate_next_retry(3) == 240
-    assert WebhookSender.calculate_next_retry(4) == 600
-    assert WebhookSender.calculate_next_retry(10) == 600  # capped
+
+@pytest.mark.parametrize(
+    "attempt,base",
+    [(0, 30), (1, 60), (2, 120), (3, 240), (4, 480), (5, 600), (10, 600)],
+)
+def test_backoff_schedule(attempt, base):
+    delays = {WebhookSender.calculate_next_retry(attempt) for _ in range(50)}
+    assert all(base * 0.5 <= d <= base * 1.5 for d in delays)
+    assert len(delays) > 1  # jitter
+
+
+async def test_send_preserialized_body(mock_http, transport):
+    transport.expect(httpx.Response(200), httpx.Response(200))
+    sender = WebhookSender(mock_http)
+    await sender.send("https://webhook.example.com/hook", b'{"order":"test"}')
+    await sender.send("https://webhook.example.com/hook", '{"order":"legacy"}')
+
+    assert [r.content for r in transport.requests] == [b'{"order":"test"}', b'{"order":"legacy"}']
+
+
+async def test_host_breaker_fails_fast_across_senders(mock_http, transport):
+    transport.expect(*[httpx.Response(503)] * 6)
+    host_breakers = {}
+    for _ in range(5):
+        with pytest.raises(WebhookSendError):
+            await WebhookSender(mock_http, host_breakers).send("https://down.example.com/a", {})
+    # Otra conexión, mismo host: no llega a hacer la request
+    with pytest.raises(WebhookSendError, match="Circuit breaker"):
+        await WebhookSender(mock_http, host_breakers).send("https://down.example.com/b", {})
+    assert len(transport.requests) == 5
+
+    with pytest.raises(WebhookSendError) as exc_info:
+        await WebhookSender(mock_http, host_breakers).send("https://up.example.com/a", {})
+    assert exc_info.value.status_code == 503
+
+    # Un sender sin el mapa compartido no hereda el breaker abierto
+    transport.expect(httpx.Response(200))
+    await WebhookSender(mock_http).send("https://down.example.com/a", {})